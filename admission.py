@@ -0,0 +1,66 @@
+import random
+from typing import Dict, Optional
+
+import metrics
+import monitoring
+from settings import (
+    MAX_CONNECTIONS, MAX_CONNECTIONS_PER_IP, SHED_LAG_SECONDS, SHED_RETRY_AFTER, RECONNECT_RATE, RECONNECT_MAX_DELAY
+)
+
+# Admission control. Caps are per worker, like everything else a worker owns.
+# Connections are counted on the worker that accepted the TCP connection;
+# sockets proxied in from another worker have already been admitted there.
+
+
+class AtCapacity(Exception):
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after()
+        metrics.admission_rejected.inc(reason)
+
+
+def retry_after() -> int:
+    # Jittered so turned-away clients don't all come back at once
+    return SHED_RETRY_AFTER + random.randint(0, SHED_RETRY_AFTER)
+
+
+def shedding() -> bool:
+    return SHED_LAG_SECONDS > 0 and monitoring.lag_average > SHED_LAG_SECONDS
+
+
+class ConnectionLimiter:
+    def __init__(self):
+        self.total = 0
+        self.by_ip: Dict[str, int] = {}
+
+    def acquire(self, ip: str) -> Optional[str]:
+        """Counts the connection in and returns None, or returns the reason it is refused."""
+        if MAX_CONNECTIONS and self.total >= MAX_CONNECTIONS:
+            reason = "connections"
+        elif MAX_CONNECTIONS_PER_IP and self.by_ip.get(ip, 0) >= MAX_CONNECTIONS_PER_IP:
+            reason = "connections_per_ip"
+        else:
+            self.total += 1
+            self.by_ip[ip] = self.by_ip.get(ip, 0) + 1
+            return None
+        metrics.admission_rejected.inc(reason)
+        return reason
+
+    def release(self, ip: str):
+        self.total -= 1
+        count = self.by_ip.get(ip, 0) - 1
+        if count > 0:
+            self.by_ip[ip] = count
+        else:
+            self.by_ip.pop(ip, None)
+
+
+limiter = ConnectionLimiter()
+
+
+def reconnect_delay() -> float:
+    """Seconds to wait before reconnecting after losing the socket. Sent to clients as they join."""
+    # If every socket here drops at once, they come back spread out instead of as one spike
+    spread = min(RECONNECT_MAX_DELAY, limiter.total / RECONNECT_RATE) if RECONNECT_RATE else 0
+    return round(random.uniform(0, spread), 2)
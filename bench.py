@@ -0,0 +1,341 @@
+"""
+Microbenchmarks for the ConnectionManager hot paths, run against fake sockets.
+
+    python bench.py                 # run and print
+    python bench.py --save          # run and overwrite bench_baseline.json
+    python bench.py --check         # run and fail if anything regressed vs the baseline
+    python bench.py broadcast undo  # only benchmarks whose name contains one of these
+
+Each benchmark reports the best of --repeat runs in microseconds per operation.
+Baselines are machine specific, so re-save on the machine you compare on.
+Otherwise only re-save the benchmarks a change is meant to move (pass their names),
+and say in the commit which numbers moved and why. Timings on a shared machine
+drift by well over --tolerance between runs, so a blanket re-save mostly records noise.
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+from starlette.requests import Request
+
+import constants
+import manager as manager_module
+from manager import ConnectionManager
+from models import GameState
+from static_assets import AssetStore
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent += 1
+
+    async def close(self, code=1000):
+        pass
+
+
+def make_room(mgr, players=8, phase=None, history=0):
+    """A room with connected players; with phase set, a game in that phase and `history` strokes."""
+    room_id = mgr.create_room(f"bench-{len(mgr.rooms)}-{time.perf_counter_ns()}")
+    room = mgr.rooms[room_id]
+    mgr.active_connections[room_id] = {}
+    for i in range(players):
+        mgr.try_join_room(room_id, f"c{i}", f"p{i}")
+        mgr.active_connections[room_id][f"c{i}"] = FakeWebSocket()
+    if phase:
+        room.state = "playing"
+        history = [stroke(i, f"a{i // 20}") for i in range(history)]
+        room.game_state = GameState(
+            round=1, drawer="p0", word="Banana", turn_queue=[f"p{i}" for i in range(1, players)],
+            timer_end=time.time() + 3600, phase=phase, current_word_obfuscated="______",
+            stroke_history=history, history_bytes=len(json.dumps(history)),
+        )
+    return room_id
+
+
+def stroke(i, action_id):
+    x = (i % 100) / 100
+    return {"x1": x, "y1": x, "x2": x + 0.01, "y2": x + 0.01, "color": "#EF4444", "actionId": action_id}
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    fn(iterations)
+    return (time.perf_counter() - started) / iterations
+
+
+def timed_async(coro_fn, iterations):
+    async def run():
+        started = time.perf_counter()
+        await coro_fn(iterations)
+        return (time.perf_counter() - started) / iterations
+    return asyncio.run(run())
+
+
+# --- Benchmarks: each returns seconds per operation ---
+
+def bench_broadcast():
+    mgr = ConnectionManager()
+    room_id = make_room(mgr, players=50)
+    msg = {"type": "DRAW_STROKE", "payload": stroke(1, "a1")}
+
+    async def run(n):
+        for _ in range(n):
+            await mgr.broadcast(room_id, msg, exclude_client="c0")
+    return timed_async(run, 2000)
+
+
+def bench_broadcast_game_state():
+    mgr = ConnectionManager()
+    room_id = make_room(mgr, players=20, phase="DRAWING")
+
+    async def run(n):
+        for _ in range(n):
+            await mgr.broadcast_game_state(room_id)
+    return timed_async(run, 500)
+
+
+def bench_record_stroke():
+    mgr = ConnectionManager()
+    room_id = make_room(mgr, phase="DRAWING")
+    s = stroke(1, "a1")
+    size = len(json.dumps({"type": "DRAW_STROKE", "payload": s}))  # main.py passes the message size
+    gs = mgr.rooms[room_id].game_state
+
+    async def run(n):
+        for i in range(n):
+            # Stay under ROOM_HISTORY_SOFT_BYTES: this measures the append, not compaction
+            if i % 10000 == 0:
+                gs.stroke_history, gs.history_bytes = [], 0
+            await mgr.record_stroke(room_id, "p0", s, size)
+    return timed_async(run, 50000)
+
+
+def bench_record_path():
+    # DRAW_PATH appends: one point each onto the open polyline
+    mgr = ConnectionManager()
+    room_id = make_room(mgr, phase="DRAWING")
+    gs = mgr.rooms[room_id].game_state
+    begin = {"op": "begin", "actionId": "a1", "color": "#EF4444", "width": 15, "points": [0.5, 0.5]}
+    append = {"op": "append", "actionId": "a1", "points": [0.5012, 0.4987]}
+
+    async def run(n):
+        for i in range(n):
+            if i % 10000 == 0:
+                gs.stroke_history, gs.history_bytes = [], 0
+                await mgr.record_stroke(room_id, "p0", begin, 100, path=True)
+            await mgr.record_stroke(room_id, "p0", append, 80, path=True)
+    return timed_async(run, 50000)
+
+
+def bench_undo_stroke_large_history():
+    # 20k strokes in actions of 20; every undo drops one action and rebroadcasts the rest
+    mgr = ConnectionManager()
+    room_id = make_room(mgr, players=4, phase="DRAWING", history=20000)
+
+    async def run(n):
+        for _ in range(n):
+            await mgr.undo_stroke(room_id, "p0")
+    return timed_async(run, 20)
+
+
+def bench_next_turn_large_vocabulary():
+    constants.WORD_SETS["Bench"] = {"Huge": [f"word{i}" for i in range(50000)]}
+    try:
+        mgr = ConnectionManager()
+        room_id = make_room(mgr, players=8, phase="DRAWER_PREPARING")
+        mgr.rooms[room_id].config.update({"word_language": "Bench", "word_difficulty": "Huge", "points_to_win": 10**9})
+
+        async def run(n):
+            for _ in range(n):
+                await mgr.next_turn(room_id)
+        return timed_async(run, 50)
+    finally:
+        del constants.WORD_SETS["Bench"]
+
+
+def bench_try_join_room():
+    mgr = ConnectionManager()
+    rooms = [mgr.create_room(f"join-{i}") for i in range(100)]
+
+    def run(n):
+        for i in range(n):
+            mgr.try_join_room(rooms[i % 100], f"c{i}", f"p{i}")
+    # Rooms grow to 200 players: measure the join itself, not MAX_PLAYERS_PER_ROOM turning them away
+    cap, manager_module.MAX_PLAYERS_PER_ROOM = manager_module.MAX_PLAYERS_PER_ROOM, 0
+    try:
+        return timed(run, 20000)
+    finally:
+        manager_module.MAX_PLAYERS_PER_ROOM = cap
+
+
+def bench_rejoin_large_room():
+    # A 100-player lobby where players drop and rejoin: the joiner's roster snapshot and the room's state push
+    mgr = ConnectionManager()
+    room_id = make_room(mgr, players=100, phase="DRAWING")
+
+    async def run(n):
+        for i in range(n):
+            client_id, nickname = f"c{i % 100}", f"p{i % 100}"
+            mgr.disconnect(room_id, client_id)
+            mgr.try_join_room(room_id, client_id, nickname)
+            mgr.active_connections[room_id][client_id] = FakeWebSocket()
+            mgr.join_success_text(room_id, {"room_id": room_id})
+            await mgr.broadcast_game_state(room_id)
+    return timed_async(run, 500)
+
+
+def bench_process_chat_message():
+    mgr = ConnectionManager()
+    room_id = make_room(mgr, players=12, phase="DRAWING")
+
+    async def run(n):
+        for i in range(n):
+            await mgr.process_chat_message(room_id, f"p{1 + i % 11}", "wrong guess")
+    return timed_async(run, 5000)
+
+
+def bench_room_actor_strokes():
+    # Strokes queued faster than the actor drains them go out as coalesced BATCH broadcasts
+    mgr = ConnectionManager()
+    room_id = make_room(mgr, players=8, phase="DRAWING")
+    s = stroke(1, "a1")
+
+    async def handle():
+        stored = await mgr.record_stroke(room_id, "p0", s, 100)
+        if stored is not None:
+            await mgr.broadcast(room_id, {"type": "DRAW_STROKE", "payload": stored}, exclude_client="c0")
+
+    async def run(n):
+        for _ in range(n):
+            await mgr.submit(room_id, handle)
+        await mgr.settle(room_id)
+    return timed_async(run, 5000)
+
+
+def bench_cleanup_empty_rooms_10k():
+    mgr = ConnectionManager()
+    template = mgr.rooms.pop(mgr.create_room("cleanup"))
+    for i in range(10000):
+        # Copies, since create_room's unique name scan would make setup quadratic.
+        # All empty but fresh, so none are evicted.
+        mgr.rooms[f"r{i}"] = dataclasses.replace(template, id=f"r{i}", name=f"cleanup-{i}", players={})
+
+    def run(n):
+        for _ in range(n):
+            mgr.cleanup_empty_rooms()
+    return timed(run, 50)
+
+
+def _serve_index(headers):
+    store = AssetStore()
+    store.load()
+    request = Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": headers})
+
+    def run(n):
+        for _ in range(n):
+            store.response(request, "index.html")
+    return timed(run, 20000)
+
+
+def bench_serve_index_br():
+    # Handler cost only; 1e6 / us_per_op is the per-core ceiling in requests/sec
+    return _serve_index([(b"accept-encoding", b"gzip, deflate, br")])
+
+
+def bench_serve_index_304():
+    etag = AssetStore()
+    etag.load()
+    etag = etag.assets["index.html"].variants["identity"][1]
+    return _serve_index([(b"accept-encoding", b"gzip, deflate, br"), (b"if-none-match", etag.encode())])
+
+
+BENCHMARKS = {
+    "broadcast": bench_broadcast,
+    "broadcast_game_state": bench_broadcast_game_state,
+    "record_stroke": bench_record_stroke,
+    "record_path": bench_record_path,
+    "undo_stroke_large_history": bench_undo_stroke_large_history,
+    "next_turn_large_vocabulary": bench_next_turn_large_vocabulary,
+    "try_join_room": bench_try_join_room,
+    "rejoin_large_room": bench_rejoin_large_room,
+    "process_chat_message": bench_process_chat_message,
+    "room_actor_strokes": bench_room_actor_strokes,
+    "cleanup_empty_rooms_10k": bench_cleanup_empty_rooms_10k,
+    "serve_index_br": bench_serve_index_br,
+    "serve_index_304": bench_serve_index_304,
+}
+
+
+def run_all(names, repeat):
+    results = {}
+    for name in names:
+        best = min(BENCHMARKS[name]() for _ in range(repeat))
+        results[name] = {"us_per_op": round(best * 1e6, 3)}
+        print(f"{name:>30}: {best * 1e6:12.3f} us/op")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("filter", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", action="store_true", help="Write results to the baseline file")
+    parser.add_argument("--check", action="store_true", help="Compare with the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before --check fails")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args()
+
+    # Slow-handler warnings would only add noise here
+    logging.disable(logging.WARNING)
+
+    names = [n for n in BENCHMARKS if not args.filter or any(f in n for f in args.filter)]
+    results = run_all(names, args.repeat)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        })
+        baseline.setdefault("results", {}).update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            ratio = result["us_per_op"] / baseline[name]["us_per_op"]
+            status = "REGRESSION" if ratio > 1 + args.tolerance else "ok"
+            print(f"{name:>30}: {ratio:6.2f}x baseline  {status}")
+            if status != "ok":
+                regressions.append(name)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,12 @@ COLORS = [
     "#FB7185", # Rose 400
 ]
 
+# Brush colors; drawColors in static/index.html offers the same ones
+DRAW_COLORS = [
+    "#000000", "#FF0000", "#00FF00", "#0000FF", "#FFFF00",
+    "#FF00FF", "#00FFFF", "#FFFFFF", "#8B4513", "#FFA500",
+]
+
 LANGUAGE_METADATA = {
     "English": "🇺🇸 English",
     "Ukrainian": "🇺🇦 Українська"
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, List
+
+import metrics
+from settings import FLIGHT_RECORDER_SIZE, FLIGHT_DIR, FLIGHT_DUMP_SECONDS, FLIGHT_DUMP_COOLDOWN
+
+logger = logging.getLogger(__name__)
+
+# Flight recorder: the last FLIGHT_RECORDER_SIZE events of each room, kept so a
+# lag spike can still be looked at after the fact. Recording appends a tuple to
+# a bounded deque; nothing is formatted until a dump. An event is
+#   (time.time(), kind, name, bytes, duration seconds, count)
+# with kind one of
+#   "in"   a socket message queued for the room's actor; count is the inbox depth
+#   "run"  the actor ran a handler; count is what was left in the inbox
+#   "out"  a broadcast or a direct send; count is the number of sockets
+# Rooms are opened by the manager, so late events for a closed room go nowhere.
+
+# room_id -> events
+_rooms: Dict[str, deque] = {}
+# room_id (or "lag") -> time.time() of the last dump written to disk
+_last_dump: Dict[str, float] = {}
+_writes = set()
+
+
+def open_room(room_id: str):
+    if FLIGHT_RECORDER_SIZE > 0:
+        _rooms.setdefault(room_id, deque(maxlen=FLIGHT_RECORDER_SIZE))
+
+
+def drop(room_id: str):
+    _rooms.pop(room_id, None)
+    _last_dump.pop(room_id, None)
+
+
+def record(room_id: str, kind: str, name: str, size: int = 0, duration: float = 0.0, count: int = 0):
+    ring = _rooms.get(room_id)
+    if ring is None:
+        return
+    ring.append((time.time(), kind, name, size, duration, count))
+    if duration > FLIGHT_DUMP_SECONDS:
+        spike(room_id, f"slow {kind} {name}: {duration * 1000:.0f}ms")
+
+
+def _format(raw: List[tuple]) -> List[dict]:
+    return [
+        {"t": round(t, 3), "kind": kind, "name": name, "bytes": size, "ms": round(duration * 1000, 2), "count": count}
+        for t, kind, name, size, duration, count in raw
+    ]
+
+
+def dump(room_id: str) -> dict:
+    """What /admin/rooms/{room_id}/flight returns: the room's events, oldest first."""
+    return {"room_id": room_id, "dumped_at": round(time.time(), 3), "events": _format(_rooms.get(room_id, ()))}
+
+
+def spike(room_id: str, reason: str):
+    """Write the room's events to FLIGHT_DIR, unless it was dumped less than FLIGHT_DUMP_COOLDOWN ago."""
+    if not FLIGHT_DIR or not _cooled_down(room_id):
+        return
+    now = time.time()
+    _write(f"{room_id}-{int(now * 1000)}.json", "handler", {
+        "room_id": room_id, "reason": reason, "dumped_at": round(now, 3), "events": list(_rooms[room_id]),
+    })
+
+
+def lag_spike(lag: float, window: float):
+    """The event loop stalled for `lag` seconds: write every room with events in the last `window` seconds."""
+    if not FLIGHT_DIR or not _cooled_down("lag"):
+        return
+    now = time.time()
+    _write(f"lag-{int(now * 1000)}.json", "lag", {
+        "reason": f"event loop lag: {lag * 1000:.0f}ms",
+        "dumped_at": round(now, 3),
+        "rooms": {room_id: list(ring) for room_id, ring in _rooms.items() if ring and ring[-1][0] >= now - window},
+    })
+
+
+def _cooled_down(key: str) -> bool:
+    now = time.time()
+    if now - _last_dump.get(key, 0) < FLIGHT_DUMP_COOLDOWN:
+        return False
+    _last_dump[key] = now
+    return True
+
+
+def _write(name: str, reason: str, report: dict):
+    # The events are copied now, while they still show the spike; formatting and writing happen in a thread
+    try:
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(_write_file, name, report))
+    except RuntimeError:
+        return  # No loop: nothing to have lagged
+    metrics.flight_dumps.inc(reason)
+    _writes.add(task)
+    task.add_done_callback(_writes.discard)
+
+
+def _write_file(name: str, report: dict):
+    if "events" in report:
+        report["events"] = _format(report["events"])
+    else:
+        report["rooms"] = {room_id: _format(raw) for room_id, raw in report["rooms"].items()}
+    try:
+        os.makedirs(FLIGHT_DIR, exist_ok=True)
+        with open(os.path.join(FLIGHT_DIR, name), "w") as f:
+            json.dump(report, f)
+    except OSError as e:
+        logger.warning(f"Could not write flight recorder dump {name}: {e}")
@@ -0,0 +1,54 @@
+import logging
+import os
+import pickle
+from typing import Optional
+
+from settings import HANDOFF_DIR, WORKER_INDEX
+
+logger = logging.getLogger(__name__)
+
+# State handoff for zero-downtime deploys. A worker drains (SIGTERM, or POST /admin/drain):
+# it stops taking rooms and input, pauses round timers, writes every room here and
+# closes all sockets with 1012 (service restart). The next process for the same worker
+# index reads the file before it takes traffic, so clients reconnect into their games
+# and resume from their last sequence number. Round timers get back the time they had left.
+# Rooms are stored as plain dicts of their fields (models.to_fields), so a deploy that
+# adds or drops a field on Room, Player or GameState can still read what the old one wrote.
+
+VERSION = 1
+
+
+def enabled() -> bool:
+    return bool(HANDOFF_DIR)
+
+
+def path() -> str:
+    return os.path.join(HANDOFF_DIR, f"handoff-{WORKER_INDEX}.pickle")
+
+
+def write(data: bytes):
+    # Renamed into place, so the next process never reads half a file
+    os.makedirs(HANDOFF_DIR, exist_ok=True)
+    tmp = path() + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path())
+
+
+def read() -> Optional[dict]:
+    """The snapshot left by the previous process, or None. Removed once read, so a later restart doesn't bring it back."""
+    try:
+        with open(path(), "rb") as f:
+            snapshot = pickle.load(f)  # Written by this app's previous process, see write
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Could not read handoff file {path()}: {e}")
+        return None
+    finally:
+        if os.path.exists(path()):
+            os.remove(path())
+    if snapshot.get("version") != VERSION:
+        logger.warning(f"Ignoring handoff file of version {snapshot.get('version')}")
+        return None
+    return snapshot
@@ -0,0 +1,319 @@
+"""
+Load generator: creates rooms through /api/rooms, connects simulated players
+to /ws/{room_id}/{client_id} and plays full games against a local server.
+
+    python loadtest.py --rooms 50 --players 6 --duration 60
+    python loadtest.py --url http://127.0.0.1:8000 --rooms 10
+
+Without --url a server is started (python serve.py, honouring --workers) on a
+free port and its process tree is sampled for CPU and memory. With --url the
+numbers come from the server's /metrics endpoint instead; run that server with
+MAX_CONNECTIONS_PER_IP=0, or the per-IP cap will turn most simulated players away.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+WRONG_GUESSES = ["cat", "house", "tree", "sun", "car", "dog", "boat", "apple"]
+
+
+class Stats:
+    def __init__(self):
+        self.stroke_sent = {}  # actionId -> perf_counter at send
+        self.stroke_latencies = []
+        self.spectator_latencies = []
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.rounds = 0
+        self.games = 0
+        self.dropped = 0
+        self.errors = []
+
+
+class Player:
+    def __init__(self, game, index, spectator=False):
+        self.game = game
+        self.nickname = f"s{index}" if spectator else f"p{index}"
+        self.client_id = uuid.uuid4().hex[:9]
+        self.is_host = index == 0 and not spectator
+        self.spectator = spectator
+        self.ws = None
+        self.drawing = None  # Task while we are the drawer
+
+    async def send(self, msg_type, payload=None):
+        self.game.stats.messages_sent += 1
+        await self.ws.send(json.dumps({"type": msg_type, "payload": payload or {}}))
+
+    async def run(self, url):
+        stats = self.game.stats
+        try:
+            async with connect(f"{url}/ws/{self.game.room_id}/{self.client_id}", max_queue=None) as ws:
+                self.ws = ws
+                await self.send("JOIN", {"nickname": self.nickname, "spectate": self.spectator})
+                async for raw in ws:
+                    stats.messages_received += 1
+                    await self.handle(json.loads(raw))
+        except ConnectionClosed:
+            pass
+        except OSError as e:
+            stats.errors.append(f"{self.nickname}@{self.game.room_id}: {e}")
+        finally:
+            if self.drawing:
+                self.drawing.cancel()
+            if not self.game.stopping:
+                stats.dropped += 1
+
+    async def handle(self, msg):
+        game, stats = self.game, self.game.stats
+        t = msg["type"]
+        if t == "BATCH":
+            for m in msg["payload"]["messages"]:
+                await self.handle(m)
+        elif t == "PING":
+            await self.send("PONG", msg["payload"])
+        elif self.spectator:
+            if t == "DRAW_STROKE":
+                sent = stats.stroke_sent.get(msg["payload"].get("actionId"))
+                if sent is not None:
+                    stats.spectator_latencies.append(time.perf_counter() - sent)
+        elif t == "JOIN_SUCCESS":
+            await self.send("TOGGLE_READY", {"is_ready": True})
+        elif t == "PLAYER_UPDATE" and self.is_host:
+            game.ready.add(msg["payload"]["nickname"])
+            if len(game.ready) == len(game.players):
+                await self.send("START_GAME")
+        elif t == "DRAW_STROKE":
+            sent = stats.stroke_sent.get(msg["payload"].get("actionId"))
+            if sent is not None:
+                stats.stroke_latencies.append(time.perf_counter() - sent)
+        elif t == "GAME_STATE_UPDATE":
+            gs = msg["payload"]["game_state"]
+            is_drawer = gs["drawer"] == self.nickname
+            if gs["phase"] == "DRAWER_PREPARING" and is_drawer:
+                game.word = gs["word"]
+                await self.send("START_ROUND")
+            elif gs["phase"] == "DRAWING" and is_drawer and not self.drawing:
+                stats.rounds += 1
+                self.drawing = asyncio.create_task(self.draw())
+            elif gs["phase"] == "DRAWING" and not is_drawer and game.guessing is None:
+                game.guessing = asyncio.create_task(game.guess_flood())
+            elif gs["phase"] != "DRAWING" and self.drawing:
+                self.drawing.cancel()
+                self.drawing = None
+            if gs["phase"] == "GAME_OVER" and self.is_host:
+                stats.games += 1
+                await self.send("START_GAME")
+
+    async def draw(self):
+        args, stats = self.game.args, self.game.stats
+        x, y = random.random(), random.random()
+        seq = 0
+        while True:
+            nx = min(1.0, max(0.0, x + random.uniform(-0.02, 0.02)))
+            ny = min(1.0, max(0.0, y + random.uniform(-0.02, 0.02)))
+            action_id = f"{self.client_id}-{seq}"
+            seq += 1
+            stats.stroke_sent[action_id] = time.perf_counter()
+            await self.send("DRAW_STROKE", {
+                "x1": x, "y1": y, "x2": nx, "y2": ny, "color": "#EF4444", "actionId": action_id
+            })
+            x, y = nx, ny
+            await asyncio.sleep(1 / args.stroke_hz)
+
+
+class Game:
+    def __init__(self, args, stats, index):
+        self.args = args
+        self.stats = stats
+        self.name = f"load-{uuid.uuid4().hex[:6]}-{index}"
+        self.room_id = None
+        self.players = [Player(self, i) for i in range(args.players)]
+        self.spectators = [Player(self, i, spectator=True) for i in range(args.spectators)]
+        self.ready = set()
+        self.word = None
+        self.guessing = None
+        self.stopping = False
+
+    async def guess_flood(self):
+        # Guessers spam wrong answers, then someone gets it right so the turn moves on
+        args = self.args
+        guessers = [p for p in self.players if p.ws and p.nickname != self.drawer_nickname()]
+        deadline = time.perf_counter() + args.round_seconds
+        try:
+            while time.perf_counter() < deadline and guessers:
+                await random.choice(guessers).send("CHAT", {"text": random.choice(WRONG_GUESSES)})
+                await asyncio.sleep(1 / args.guess_hz)
+            for p in guessers:
+                if self.word:
+                    await p.send("CHAT", {"text": self.word})
+        except ConnectionClosed:
+            pass
+        finally:
+            self.guessing = None
+
+    def drawer_nickname(self):
+        return next((p.nickname for p in self.players if p.drawing), None)
+
+    async def run(self, url):
+        http_url = url.replace("ws", "http", 1)
+        body = json.dumps({"name": self.name}).encode()
+        req = urllib.request.Request(f"{http_url}/api/rooms", data=body, headers={"Content-Type": "application/json"})
+        resp = await asyncio.to_thread(urllib.request.urlopen, req)
+        self.room_id = json.loads(resp.read())["room_id"]
+        await asyncio.gather(*(p.run(url) for p in self.players + self.spectators))
+
+    async def stop(self):
+        self.stopping = True
+        for p in self.players + self.spectators:
+            if p.ws:
+                await p.ws.close()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def _proc_children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(c) for c in f.read().split()]
+    except OSError:
+        return []
+
+
+def process_tree_usage(pid):
+    """(cpu seconds, rss bytes) of pid and all its descendants, from /proc."""
+    cpu, rss = 0.0, 0
+    ticks, page = os.sysconf("SC_CLK_TCK"), os.sysconf("SC_PAGE_SIZE")
+    stack = [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / ticks
+            rss += int(fields[21]) * page
+        except (OSError, IndexError):
+            continue
+        stack.extend(_proc_children(p))
+    return cpu, rss
+
+
+def scraped_usage(http_url):
+    text = urllib.request.urlopen(f"{http_url}/metrics").read().decode()
+    values = dict(line.rsplit(" ", 1) for line in text.splitlines() if line.startswith("process_"))
+    return float(values["process_cpu_seconds_total"]), int(float(values["process_resident_memory_bytes"]))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(http_url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{http_url}/api/rooms")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {http_url} did not come up")
+
+
+async def run(args, url, usage):
+    stats = Stats()
+    games = [Game(args, stats, i) for i in range(args.rooms)]
+    cpu_start, _ = usage()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(g.run(url)) for g in games]
+    await asyncio.sleep(args.duration)
+    elapsed = time.perf_counter() - started
+    cpu_end, rss = usage()
+    for g in games:
+        await g.stop()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats, elapsed, cpu_end - cpu_start, rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Existing server, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--workers", type=int, default=1, help="WORKERS for the spawned server")
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--spectators", type=int, default=0, help="Spectators per room")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--stroke-hz", type=float, default=60)
+    parser.add_argument("--guess-hz", type=float, default=5, help="Wrong guesses per second per room")
+    parser.add_argument("--round-seconds", type=float, default=10, help="Drawing time before the word is guessed")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        http_url = args.url.rstrip("/")
+        usage = lambda: scraped_usage(http_url)
+    else:
+        port = free_port()
+        http_url = f"http://127.0.0.1:{port}"
+        # Every simulated client comes from 127.0.0.1
+        env = dict(os.environ, PORT=str(port), HOST="127.0.0.1", WORKERS=str(args.workers), MAX_CONNECTIONS_PER_IP="0")
+        server = subprocess.Popen([sys.executable, "serve.py"], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        usage = lambda: process_tree_usage(server.pid)
+
+    try:
+        wait_for_server(http_url)
+        ws_url = http_url.replace("http", "ws", 1)
+        stats, elapsed, cpu, rss = asyncio.run(run(args, ws_url, usage))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    lat = stats.stroke_latencies
+    report = {
+        "rooms": args.rooms,
+        "players_per_room": args.players,
+        "duration_s": round(elapsed, 1),
+        "messages_sent": stats.messages_sent,
+        "messages_received": stats.messages_received,
+        "strokes_delivered": len(lat),
+        "stroke_latency_p50_ms": round(percentile(lat, 50) * 1000, 2),
+        "stroke_latency_p99_ms": round(percentile(lat, 99) * 1000, 2),
+        "stroke_latency_max_ms": round(max(lat, default=0) * 1000, 2),
+        "spectators_per_room": args.spectators,
+        "spectator_latency_p50_ms": round(percentile(stats.spectator_latencies, 50) * 1000, 2),
+        "spectator_latency_p99_ms": round(percentile(stats.spectator_latencies, 99) * 1000, 2),
+        "rounds_started": stats.rounds,
+        "games_finished": stats.games,
+        "server_cpu_cores": round(cpu / elapsed, 2),
+        "server_rss_mb": round(rss / 2**20, 1),
+        "dropped_connections": stats.dropped,
+        "errors": stats.errors[:10],
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for k, v in report.items():
+            print(f"{k:>24}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,89 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import asyncio
 import logging
 import json
 import os
+import secrets
+import threading
+import time
 
 from models import CreateRoomRequest
-from manager import manager
+from manager import manager, batch_text
+import admission
+import flight
+import handoff
+import metrics
+import monitoring
+import profiler
+import replay
+import sharding
+from static_assets import assets
+from settings import (
+    REPLAY_DIR, ADMIN_TOKEN, MAX_CHAT_LENGTH, CHAT_MESSAGES_PER_SECOND, MAX_STROKE_MESSAGE_BYTES,
+    PROFILE_MAX_SECONDS, WORKERS, WORKER_INDEX
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Client message types we handle; anything else is counted as OTHER to keep metric labels bounded
+MESSAGE_TYPES = {
+    "JOIN", "TOGGLE_READY", "UPDATE_CONFIG", "START_GAME", "CHAT", "DRAW_STROKE",
+    "DRAW_PATH", "UNDO_STROKE", "START_ROUND", "CLEAR_CANVAS", "LEAVE_ROOM", "PONG"
+}
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app = FastAPI()
 
 @app.on_event("startup")
 async def startup_event():
     import asyncio
+    # Read and precompress static/ before taking traffic
+    assets.load()
+    # Likewise the rooms of the process we replace, if it drained them for us
+    if handoff.enabled():
+        snapshot = await asyncio.to_thread(handoff.read)
+        if snapshot:
+            await manager.restore(snapshot)
+
     async def cleanup_loop():
         while True:
             await asyncio.sleep(60) # Every minute
             manager.cleanup_empty_rooms()
+            await manager.enforce_budgets()
+            await manager.hibernate_idle_rooms()
     asyncio.create_task(cleanup_loop())
+    asyncio.create_task(monitoring.loop_lag_monitor())
+    asyncio.create_task(manager.spectator_flush_loop())
+    asyncio.create_task(manager.heartbeat_loop())
+    if replay.enabled():
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        asyncio.create_task(manager.replay_flush_loop())
+
+    if sharding.is_sharded():
+        asyncio.create_task(sharding.backplane.run())
+        asyncio.create_task(sharding.sync_lobby(manager.public_rooms))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # SIGTERM: uvicorn has already closed the sockets (1012), so this pauses timers and writes the rooms
+    if handoff.enabled():
+        await manager.drain()
 
 @app.get("/")
-async def get():
+async def get(request: Request):
     # Return index.html as a static file to avoid Jinja2 template parsing of Vue.js delimiters
-    return FileResponse("static/index.html")
+    return assets.response(request, "index.html")
 
 @app.get("/rooms/{room_id}")
-async def get_room(room_id: str):
+async def get_room(room_id: str, request: Request):
     # Serve the same index.html for room routes (SPA fallback)
-    return FileResponse("static/index.html")
+    return assets.response(request, "index.html")
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def get_static(path: str, request: Request):
+    # HEAD too, as the StaticFiles mount did: health checks and CDNs probe with it
+    return assets.response(request, path)
 
 @app.post("/api/rooms")
 async def create_room(request: CreateRoomRequest):
@@ -40,27 +91,389 @@ async def create_room(request: CreateRoomRequest):
     try:
         room_id = manager.create_room(request.name, request.password, request.game_type, config_dict)
         return {"room_id": room_id, "message": "Room created"}
+    except admission.AtCapacity as e:
+        return JSONResponse(
+            status_code=503,
+            content={"message": str(e), "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except ValueError as e:
         return JSONResponse(status_code=400, content={"message": str(e)})
 
 @app.get("/api/rooms")
 async def list_rooms():
-    public_rooms = []
-    for r_id, r_data in manager.rooms.items():
-        public_rooms.append({
-            "id": r_data["id"],
-            "name": r_data["name"],
-            "has_password": bool(r_data["password"]),
-            "players_count": sum(1 for p in r_data["players"].values() if p["connected"])
-        })
-    return public_rooms
+    return manager.list_rooms()
+
+@app.get("/api/replays")
+async def list_replays(room_id: str = None):
+    # REPLAY_DIR is shared by all workers, so no proxying needed
+    if not replay.enabled():
+        raise HTTPException(status_code=404, detail="Replays are disabled")
+    return await asyncio.to_thread(replay.list_games, room_id)
+
+@app.get("/api/replays/{game_id}")
+async def get_replay(game_id: str, round: int = None):
+    # Newline-delimited "<ms> <message>" events, streamed from disk; ?round=N for a single round
+    if not replay.enabled():
+        raise HTTPException(status_code=404, detail="Replays are disabled")
+    span = await asyncio.to_thread(replay.byte_range, game_id, round)
+    if span is None:
+        raise HTTPException(status_code=404, detail="Replay not found")
+    return StreamingResponse(replay.stream(game_id, *span), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def get_metrics():
+    # Per process: in sharded mode each worker reports its own rooms
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def require_admin(request: Request):
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/admin/rooms")
+async def admin_rooms(request: Request):
+    # Rooms of this worker, largest first
+    require_admin(request)
+    return manager.memory_report()
+
+@app.get("/admin/rooms/{room_id}")
+async def admin_room(room_id: str, request: Request):
+    require_admin(request)
+    if not sharding.is_local(room_id):
+        return await sharding.proxy_http(request, room_id)
+    if room_id not in manager.rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return manager.room_memory(room_id)
+
+@app.get("/admin/rooms/{room_id}/clients")
+async def admin_room_clients(room_id: str, request: Request):
+    # Heartbeat RTT and idle time per socket
+    require_admin(request)
+    if not sharding.is_local(room_id):
+        return await sharding.proxy_http(request, room_id)
+    if room_id not in manager.rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return manager.client_report(room_id)
+
+@app.get("/admin/rooms/{room_id}/flight")
+async def admin_room_flight(room_id: str, request: Request):
+    # The room's last events in and out, with sizes, handler durations and inbox depths
+    require_admin(request)
+    if not sharding.is_local(room_id):
+        return await sharding.proxy_http(request, room_id)
+    if room_id not in manager.rooms:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return flight.dump(room_id)
+
+@app.get("/admin/profile")
+async def admin_profile(
+    request: Request, seconds: float = 10, interval: float = 0.01, threads: str = "loop",
+    worker: int = None, room_id: str = None
+):
+    """
+    Sample this worker's stacks for `seconds` and return them collapsed, for a flamegraph.
+    threads=all adds the offload and other threads to the event loop's. In sharded mode,
+    worker= or room_id= picks the worker to profile.
+    """
+    require_admin(request)
+    target = sharding.owner_of(room_id) if room_id else worker
+    if target is not None and target != WORKER_INDEX:
+        if not 0 <= target < WORKERS:
+            raise HTTPException(status_code=404, detail="No such worker")
+        return await sharding.proxy_http_to(request, target)
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    interval = max(interval, 0.001)
+    try:
+        stacks = await asyncio.to_thread(profiler.sample, threading.get_ident(), seconds, interval, threads == "all")
+    except profiler.Busy:
+        raise HTTPException(status_code=409, detail="A profile is already running on this worker")
+    filename = f"worker{WORKER_INDEX}-{int(time.time())}.folded"
+    return PlainTextResponse(stacks, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.post("/admin/drain")
+async def admin_drain(request: Request, worker: int = None):
+    """
+    Drain this worker (or worker=) ahead of a deploy: refuse new rooms and sockets, pause
+    round timers, write the rooms to HANDOFF_DIR and tell every client to reconnect.
+    """
+    require_admin(request)
+    if worker is not None and worker != WORKER_INDEX:
+        if not 0 <= worker < WORKERS:
+            raise HTTPException(status_code=404, detail="No such worker")
+        return await sharding.proxy_http_to(request, worker)
+    return dict(await manager.drain(), worker=WORKER_INDEX)
 
 @app.get("/api/word-sets/metadata")
 async def get_word_set_metadata():
     return manager.get_word_set_metadata()
 
+async def handle_client_message(session: dict, msg: dict, data: str):
+    """Runs on the room's actor, so it never interleaves with another handler for the same room."""
+    websocket, room, room_id, client_id = session["websocket"], session["room"], session["room_id"], session["client_id"]
+    current_nickname = session["nickname"]
+    msg_type = msg.get("type")
+    started = time.perf_counter()
+    try:
+        if msg_type == "JOIN" and msg.get("payload", {}).get("spectate"):
+            # Spectators never get a nickname, so every other message type ignores them
+            if current_nickname:
+                return
+            payload = msg.get("payload", {})
+            result = manager.add_spectator(room_id, client_id, payload.get("password"), payload.get("token"))
+            if result == "OK":
+                # Like a player, a reconnecting spectator only gets what it missed (the public views)
+                missed = None
+                if isinstance(payload.get("resume_from"), int):
+                    missed = manager.messages_since(room_id, client_id, None, payload["resume_from"])
+                join_success = manager.join_success_text(room_id, {
+                    "room_id": room_id,
+                    "state": room.state,
+                    "game_type": room.game_type,
+                    "config": room.config,
+                    "config_version": room.config_version,
+                    "seq": room.seq,
+                    "resumed": missed is not None,
+                    "spectator": True
+                })
+                if missed is None:
+                    await manager.send_text_to_client(room_id, client_id, join_success, "JOIN_SUCCESS")
+                else:
+                    await manager.send_text_to_client(room_id, client_id, batch_text([join_success] + missed), "BATCH")
+                if room.state == "playing" and missed is None:
+                    await manager.send_full_state_to_client(room_id, client_id, None)
+            elif result == "WRONG_PASSWORD":
+                await manager.send_to_client(room_id, client_id, {
+                    "type": "ERROR",
+                    "payload": {"message": "Incorrect password"}
+                })
+            elif result == "OVERLOADED":
+                await manager.send_to_client(room_id, client_id, {
+                    "type": "ERROR",
+                    "payload": {"message": "The server is busy.", "retry_after": admission.retry_after()}
+                })
+
+        elif msg_type == "JOIN":
+            # A spectator socket stays one; playing takes a new connection
+            if client_id in manager.spectators.get(room_id, {}):
+                return
+            nickname = msg.get("payload", {}).get("nickname", "Anonymous")
+            password = msg.get("payload", {}).get("password")
+            token = msg.get("payload", {}).get("token")
+            resume_from = msg.get("payload", {}).get("resume_from")
+            result = manager.try_join_room(room_id, client_id, nickname, password, token)
+
+            if result == "OK":
+                current_nickname = session["nickname"] = nickname
+
+                # A reconnecting client that says where it left off only gets what it missed
+                missed = None
+                if isinstance(resume_from, int):
+                    missed = manager.messages_since(room_id, client_id, nickname, resume_from)
+
+                # Send Success to self, with a snapshot of the roster
+                join_success = manager.join_success_text(room_id, {
+                    "room_id": room_id,
+                    "state": room.state,
+                    "game_type": room.game_type,
+                    "config": room.config,
+                    "config_version": room.config_version,
+                    "room_token": room.room_token,
+                    "seq": room.seq,
+                    "resumed": missed is not None,
+                    "reconnect_delay": admission.reconnect_delay()
+                })
+                if missed is None:
+                    await manager.send_text_to_client(room_id, client_id, join_success, "JOIN_SUCCESS")
+                else:
+                    # One message, so nothing broadcast meanwhile can overtake the missed ones
+                    await manager.send_text_to_client(room_id, client_id, batch_text([join_success] + missed), "BATCH")
+
+                # Broadcast to room; joins arriving together go out as one PLAYERS_JOINED
+                await manager.announce_join(room_id, nickname)
+
+                # Sync state for the newly joined/reconnected player
+                if room.state == "playing" and missed is None:
+                    await manager.send_full_state_to_client(room_id, client_id, nickname)
+
+                await manager.enforce_room_budget(room_id)
+            elif result == "TAKEN":
+                await manager.send_to_client(room_id, client_id, {
+                    "type": "ERROR",
+                    "payload": {"message": "Nickname is already taken in this room."}
+                })
+            elif result == "GAME_STARTED":
+                 await manager.send_to_client(room_id, client_id, {
+                    "type": "ERROR",
+                    "payload": {"message": "Game has already started in this room. You can only join if you were already playing."}
+                })
+            elif result == "WRONG_PASSWORD":
+                 await manager.send_to_client(room_id, client_id, {
+                    "type": "ERROR",
+                    "payload": {"message": "Incorrect password"}
+                })
+            elif result == "INVALID_NICKNAME":
+                 await manager.send_to_client(room_id, client_id, {
+                    "type": "ERROR",
+                    "payload": {"message": "Nickname is invalid or too long."}
+                })
+            elif result == "ROOM_FULL":
+                 await manager.send_to_client(room_id, client_id, {
+                    "type": "ERROR",
+                    "payload": {"message": "This room is full."}
+                })
+            elif result == "OVERLOADED":
+                 await manager.send_to_client(room_id, client_id, {
+                    "type": "ERROR",
+                    "payload": {"message": "The server is busy.", "retry_after": admission.retry_after()}
+                })
+
+        elif msg_type == "TOGGLE_READY":
+             if current_nickname:
+                 is_ready = msg.get("payload", {}).get("is_ready", False)
+                 manager.set_player_ready(room_id, current_nickname, is_ready)
+                 await manager.broadcast(room_id, {
+                     "type": "PLAYER_UPDATE",
+                     "payload": {
+                         "nickname": current_nickname,
+                         "is_ready": is_ready,
+                         "roster_version": room.roster_version
+                     }
+                 })
+
+        elif msg_type == "UPDATE_CONFIG":
+            if current_nickname and room.players[current_nickname].is_host:
+                new_config = msg.get("payload", {}).get("config", {})
+                if isinstance(new_config, dict):
+                    await manager.update_game_config(room_id, new_config)
+
+        elif msg_type == "START_GAME":
+             # Verify host
+             if current_nickname and room.players[current_nickname].is_host:
+                 # Changes the host made just before starting still count
+                 await manager.flush_config(room_id)
+                 if manager.can_start_game(room_id):
+                     await manager.start_game(room_id) # Now async
+                     # GAME_STARTED broadcast is inside start_game -> broadcast_game_state
+                 else:
+                      await manager.send_to_client(room_id, client_id, {
+                        "type": "ERROR",
+                        "payload": {"message": "Cannot start game. Need 2+ players and all ready."}
+                    })
+
+        elif msg_type == "CHAT":
+             # Rate limited on arrival, see websocket_session
+             text = msg.get("payload", {}).get("text")
+             if current_nickname and isinstance(text, str):
+                 await manager.process_chat_message(room_id, current_nickname, text[:MAX_CHAT_LENGTH])
+
+        elif msg_type == "DRAW_STROKE":
+            if current_nickname and len(data) <= MAX_STROKE_MESSAGE_BYTES:
+                # Relayed as stored: in canonical form
+                stroke = await manager.record_stroke(room_id, current_nickname, msg.get("payload"), len(data))
+                if stroke is not None:
+                    await manager.broadcast(room_id, {
+                        "type": "DRAW_STROKE",
+                        "payload": stroke
+                    }, exclude_client=client_id)
+
+        elif msg_type == "DRAW_PATH":
+            if current_nickname and len(data) <= MAX_STROKE_MESSAGE_BYTES:
+                op = await manager.record_stroke(room_id, current_nickname, msg.get("payload"), len(data), path=True)
+                if op is not None:
+                    await manager.broadcast(room_id, {
+                        "type": "DRAW_PATH",
+                        "payload": op
+                    }, exclude_client=client_id)
+
+        elif msg_type == "UNDO_STROKE":
+            if current_nickname:
+                await manager.undo_stroke(room_id, current_nickname)
+
+        elif msg_type == "START_ROUND":
+            if current_nickname:
+                await manager.start_active_round(room_id)
+
+        elif msg_type == "CLEAR_CANVAS":
+            if current_nickname:
+                await manager.clear_canvas_history(room_id, current_nickname)
+
+        elif msg_type == "LEAVE_ROOM":
+            # Explicit leave
+            if current_nickname:
+                # If host, close room
+                if room.players[current_nickname].is_host:
+                    await manager.close_room(room_id)
+                    # Close logic closes sockets, so the receive loop ends on its own
+                    return
+                else:
+                    # Just remove player? Or let them disconnect normally?
+                    # Standard leave behavior is just disconnect usually, but we want to free the nickname perhaps?
+                    # For now, let's treat it as a disconnect but maybe explicit remove from players dict?
+                    # If we remove strictly, reconnect won't work. 
+                    # If they explicitly clicked "Leave", they probably don't want to reconnect to the same state.
+                    # So removing is correct.
+                    manager.remove_player_from_room(room_id, current_nickname)
+                    await manager.broadcast(room_id, {
+                        "type": "PLAYER_LEFT",
+                        "payload": {"nickname": current_nickname, "roster_version": room.roster_version}
+                    })
+                    session["nickname"] = None # Gone for good, not just disconnected
+                    # Close socket
+                    await websocket.close()
+                    return
+    finally:
+        metric_type = msg_type if msg_type in MESSAGE_TYPES else "OTHER"
+        monitoring.check_slow(f"ws:{metric_type}", time.perf_counter() - started, room_id, msg_type, len(data))
+
+async def handle_client_disconnect(session: dict):
+    room_id, client_id, current_nickname = session["room_id"], session["client_id"], session["nickname"]
+    # False if the client already came back on a new socket (e.g. after being reaped)
+    still_current = manager.disconnect(room_id, client_id, session["websocket"])
+    # If user disconnected, we notify others but don't delete them from data immediately (to allow reconnect)
+    if still_current and current_nickname and room_id in manager.rooms:
+         # Check if player is still marked as disconnected in manager 
+         # (manager.disconnect sets it to False)
+         # We broadcast that they left/disconnected
+         await manager.broadcast(room_id, {
+            "type": "PLAYER_DISCONNECTED",
+            "payload": {
+                "nickname": current_nickname,
+                "roster_version": manager.rooms[room_id].roster_version
+            }
+        })
+    logger.info(f"Client {client_id} disconnected")
+
 @app.websocket("/ws/{room_id}/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, room_id: str, client_id: str):
+    if sharding.from_worker(websocket):
+        # Proxied by the worker that admitted it, which already counted it
+        await websocket_session(websocket, room_id, client_id)
+        return
+
+    # The forwarded client address when the peer is a trusted proxy (FORWARDED_ALLOW_IPS), see serve.py
+    ip = websocket.client.host if websocket.client else "unknown"
+    if admission.limiter.acquire(ip):
+        await websocket.accept()
+        await websocket.close(code=1013, reason=f"retry-after={admission.retry_after()}") # Try again later
+        return
+    try:
+        await websocket_session(websocket, room_id, client_id)
+    finally:
+        admission.limiter.release(ip)
+
+async def websocket_session(websocket: WebSocket, room_id: str, client_id: str):
+    if not sharding.is_local(room_id):
+        # Room lives on another worker
+        await sharding.proxy_websocket(websocket, room_id)
+        return
+
+    if manager.draining:
+        # Restarting: come back to the next process
+        await websocket.accept()
+        await websocket.close(code=1012, reason=f"retry-after={admission.reconnect_delay()}")
+        return
+
     room = manager.get_room(room_id)
     if not room:
         await websocket.accept()
@@ -68,179 +481,60 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, client_id: str)
         return
 
     await manager.connect(websocket, room_id, client_id)
-    
-    current_nickname = None
+    session = {
+        "websocket": websocket,
+        "room": room,
+        "room_id": room_id,
+        "client_id": client_id,
+        "nickname": None # Set by a successful JOIN
+    }
+    # Chat flood protection: at most CHAT_MESSAGES_PER_SECOND per socket
+    chat_window_start, chat_count = 0.0, 0
 
     try:
         while True:
             data = await websocket.receive_text()
+            manager.touch(room_id, client_id)
             try:
                 msg = json.loads(data)
-                msg_type = msg.get("type")
-                
-                if msg_type == "JOIN":
-                    nickname = msg.get("payload", {}).get("nickname", "Anonymous")
-                    password = msg.get("payload", {}).get("password")
-                    token = msg.get("payload", {}).get("token")
-                    result = manager.try_join_room(room_id, client_id, nickname, password, token)
-                    
-                    if result == "OK":
-                        current_nickname = nickname
-                        
-                        # Send Success to self
-                        player_list = []
-                        for n, p in room["players"].items():
-                            player_list.append({
-                                "nickname": n,
-                                "is_host": p["is_host"],
-                                "is_ready": p.get("is_ready", False),
-                                "color": p.get("color", "#FFFFFF"),
-                                "connected": p.get("connected", True),
-                                "score": p.get("score", 0)
-                            })
-                        
-                        await manager.send_to_client(room_id, client_id, {
-                            "type": "JOIN_SUCCESS",
-                            "payload": {
-                                "room_id": room_id,
-                                "players": player_list,
-                                "state": room["state"],
-                                "game_type": room["game_type"],
-                                "config": room["config"],
-                                "room_token": room.get("room_token")
-                            }
-                        })
-
-                        # Broadcast to room
-                        await manager.broadcast(room_id, {
-                            "type": "PLAYER_JOINED",
-                            "payload": {
-                                "nickname": nickname,
-                                "is_ready": False,
-                                "color": room["players"][nickname].get("color", "#FFFFFF"),
-                                "connected": room["players"][nickname].get("connected", True),
-                                "total_players": len(player_list)
-                            }
-                        })
-
-                        # Sync state for the newly joined/reconnected player
-                        if room.get("state") == "playing":
-                            await manager.send_full_state_to_client(room_id, client_id, nickname)
-                    elif result == "TAKEN":
-                        await manager.send_to_client(room_id, client_id, {
-                            "type": "ERROR",
-                            "payload": {"message": "Nickname is already taken in this room."}
-                        })
-                    elif result == "GAME_STARTED":
-                         await manager.send_to_client(room_id, client_id, {
-                            "type": "ERROR",
-                            "payload": {"message": "Game has already started in this room. You can only join if you were already playing."}
-                        })
-                    elif result == "WRONG_PASSWORD":
-                         await manager.send_to_client(room_id, client_id, {
-                            "type": "ERROR",
-                            "payload": {"message": "Incorrect password"}
-                        })
-                
-                elif msg_type == "TOGGLE_READY":
-                     if current_nickname:
-                         is_ready = msg.get("payload", {}).get("is_ready", False)
-                         manager.set_player_ready(room_id, current_nickname, is_ready)
-                         await manager.broadcast(room_id, {
-                             "type": "PLAYER_UPDATE",
-                             "payload": {
-                                 "nickname": current_nickname,
-                                 "is_ready": is_ready
-                             }
-                         })
-                
-                elif msg_type == "UPDATE_CONFIG":
-                    if current_nickname and room["players"][current_nickname]["is_host"]:
-                        new_config = msg.get("payload", {}).get("config", {})
-                        manager.update_game_config(room_id, new_config)
-                        await manager.broadcast(room_id, {
-                            "type": "CONFIG_UPDATE",
-                            "payload": {
-                                "config": room["config"]
-                            }
-                        })
-
-                elif msg_type == "START_GAME":
-                     # Verify host
-                     if current_nickname and room["players"][current_nickname]["is_host"]:
-                         if manager.can_start_game(room_id):
-                             await manager.start_game(room_id) # Now async
-                             # GAME_STARTED broadcast is inside start_game -> broadcast_game_state
-                         else:
-                              await manager.send_to_client(room_id, client_id, {
-                                "type": "ERROR",
-                                "payload": {"message": "Cannot start game. Need 2+ players and all ready."}
-                            })
-
-                elif msg_type == "CHAT":
-                     if current_nickname:
-                         await manager.process_chat_message(room_id, current_nickname, msg.get("payload", {}).get("text"))
-
-                elif msg_type == "DRAW_STROKE":
-                    if current_nickname:
-                        await manager.record_stroke(room_id, current_nickname, msg.get("payload"))
-                        await manager.broadcast(room_id, {
-                            "type": "DRAW_STROKE",
-                            "payload": msg.get("payload")
-                        }, exclude_client=client_id)
-                
-                elif msg_type == "UNDO_STROKE":
-                    if current_nickname:
-                        await manager.undo_stroke(room_id, current_nickname)
-
-                elif msg_type == "START_ROUND":
-                    if current_nickname:
-                        await manager.start_active_round(room_id)
-
-                elif msg_type == "CLEAR_CANVAS":
-                    if current_nickname:
-                        await manager.clear_canvas_history(room_id, current_nickname)
-
-                elif msg_type == "LEAVE_ROOM":
-                    # Explicit leave
-                    if current_nickname:
-                        # If host, close room
-                        if room["players"][current_nickname]["is_host"]:
-                            await manager.close_room(room_id)
-                            # Close logic closes sockets, so loop will break or we should break here? 
-                            # Connection closed exception will be raised or we break.
-                            break
-                        else:
-                            # Just remove player? Or let them disconnect normally?
-                            # Standard leave behavior is just disconnect usually, but we want to free the nickname perhaps?
-                            # For now, let's treat it as a disconnect but maybe explicit remove from players dict?
-                            # If we remove strictly, reconnect won't work. 
-                            # If they explicitly clicked "Leave", they probably don't want to reconnect to the same state.
-                            # So removing is correct.
-                            await manager.broadcast(room_id, {
-                                "type": "PLAYER_LEFT",
-                                "payload": {"nickname": current_nickname}
-                            })
-                            manager.remove_player_from_room(room_id, current_nickname)
-                            # Close socket
-                            await websocket.close()
-                            # Break loop
-                            break
-                
             except json.JSONDecodeError:
-                pass
-                
+                continue
+            if not isinstance(msg, dict):
+                continue
+            msg_type = msg.get("type")
+            metric_type = msg_type if msg_type in MESSAGE_TYPES else "OTHER"
+            metrics.messages_received.inc(metric_type)
+            metrics.bytes_received.inc(metric_type, amount=len(data))
+
+            if msg_type == "PONG":
+                # Answered here rather than on the actor so queueing doesn't inflate the RTT
+                payload = msg.get("payload")
+                manager.record_pong(room_id, client_id, payload.get("t") if isinstance(payload, dict) else None)
+                continue
+            if msg_type == "CHAT":
+                now = time.monotonic()
+                if now - chat_window_start >= 1:
+                    chat_window_start, chat_count = now, 0
+                chat_count += 1
+                if chat_count > CHAT_MESSAGES_PER_SECOND:
+                    continue
+
+            if manager.draining:
+                continue  # The room is saved as of the drain; its socket is about to close
+
+            # Handled in order by the room's actor; only waits when its inbox is full
+            flight.record(room_id, "in", metric_type, len(data), 0.0, manager.inbox_depth(room_id))
+            await manager.submit(room_id, handle_client_message, session, msg, data)
+
     except WebSocketDisconnect:
-        manager.disconnect(room_id, client_id)
-        # If user disconnected, we notify others but don't delete them from data immediately (to allow reconnect)
-        if current_nickname and room_id in manager.rooms:
-             # Check if player is still marked as disconnected in manager 
-             # (manager.disconnect sets it to False)
-             # We broadcast that they left/disconnected
-             await manager.broadcast(room_id, {
-                "type": "PLAYER_DISCONNECTED",
-                "payload": {
-                    "nickname": current_nickname
-                }
-            })
-        logger.info(f"Client {client_id} disconnected")
+        pass
+    except Exception:
+        # Whatever went wrong, the player must still be marked disconnected and the room told
+        logger.exception(f"Session of client {client_id} in room {room_id} failed")
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    if not await manager.submit(room_id, handle_client_disconnect, session):
+        # The room was closed under this socket: nobody to tell, but the socket's own state still has to go
+        await handle_client_disconnect(session)
@@ -1,31 +1,204 @@
 from fastapi import WebSocket
 from typing import List, Dict, Optional
+from collections import deque
+from itertools import islice
 import uuid
 import json
 import asyncio
 import time
 import hashlib
+import random
+import logging
+import pickle
 import secrets
+import zlib
+
+from pydantic import ValidationError
+
+import admission
+import flight
+import handoff
+import metrics
+import offload
+import replay
+import sharding
+from models import GameConfig, GameState, Player, Room, to_fields, from_fields
+from monitoring import traced, check_slow
+from settings import (
+    SPECTATOR_FLUSH_INTERVAL, REPLAY_FLUSH_INTERVAL, OFFLOAD_MIN_BYTES, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT,
+    RESUME_BUFFER_SIZE, HIBERNATE_AFTER, DRAIN_TIMEOUT, JOIN_COALESCE_WINDOW, CONFIG_COALESCE_WINDOW, ROOM_INBOX_SIZE, ROOM_BATCH_SIZE, MAX_ROOMS, MAX_PLAYERS_PER_ROOM, MAX_NICKNAME_LENGTH, MAX_ROOM_NAME_LENGTH, ROOM_HISTORY_SOFT_BYTES, ROOM_HISTORY_HARD_BYTES, ROOM_MAX_BYTES
+)
+from strokes import apply_path_op, canonical_path_op, canonical_segment, compact_history, snapshot_history
+
+logger = logging.getLogger(__name__)
+
+# Broadcasts an actor may merge into one BATCH while it works through several queued inputs
+COALESCED_TYPES = {"DRAW_STROKE", "DRAW_PATH", "CHAT"}
+
+# Queued by stop_actor in place of a (handler, args) pair
+STOP = object()
+
+# Keys a host may set through UPDATE_CONFIG
+CONFIG_KEYS = (
+    "round_duration", "points_to_win", "base_points", "turn_order", "host_plays", "word_language", "word_difficulty"
+)
+
+
+def batch_text(texts: List[str]) -> str:
+    # Messages are already JSON, so the batch is built by concatenation
+    return '{"type": "BATCH", "payload": {"messages": [' + ", ".join(texts) + ']}}'
+
+
+def freeze_room(game_state: Optional[GameState], outbox: list) -> bytes:
+    # As fields rather than a GameState, so a room hibernated before a deploy wakes after it (handoff.py)
+    state = to_fields(game_state) if game_state is not None else None
+    return zlib.compress(pickle.dumps((state, outbox), pickle.HIGHEST_PROTOCOL))
+
+
+def thaw_room(frozen: bytes) -> tuple:
+    state, outbox = pickle.loads(zlib.decompress(frozen))
+    return (from_fields(GameState, state) if state is not None else None), outbox
+
+
+def room_to_fields(room: Room) -> dict:
+    values = to_fields(room)
+    values["players"] = [to_fields(p) for p in room.players.values()]
+    values["game_state"] = to_fields(room.game_state) if room.game_state is not None else None
+    values["outbox"] = list(room.outbox)
+    return values
+
+
+def room_from_fields(values: dict) -> Room:
+    values = dict(values)
+    players = [from_fields(Player, p) for p in values.pop("players")]
+    game_state = values.pop("game_state")
+    room = from_fields(Room, values)
+    room.players = {p.nickname: p for p in players}
+    room.game_state = from_fields(GameState, game_state) if game_state is not None else None
+    room.replace_outbox(deque(room.outbox, maxlen=RESUME_BUFFER_SIZE))
+    return room
+
+
+def merge_config(config: dict, changes: dict) -> dict:
+    """
+    config with changes applied, checked against GameConfig. A change that
+    doesn't validate is dropped and its key keeps its current value.
+    """
+    merged = {**config, **changes}
+    try:
+        checked = GameConfig(**merged).dict()
+    except ValidationError as e:
+        rejected = {err["loc"][0] for err in e.errors() if err["loc"]}
+        merged = {k: v for k, v in merged.items() if k not in rejected}
+        merged.update((k, config[k]) for k in rejected if k in config)
+        checked = GameConfig(**merged).dict()
+    checked["base_points"] = min(checked["base_points"], checked["points_to_win"])
+    return checked
+
+
+def history_text(encoded: str) -> str:
+    return f'{{"type": "STROKE_HISTORY_UPDATE", "payload": {{"history": {encoded}}}}}'
+
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, clock=time.time, rng: random.Random = None):
+        # Game time and chance: clock() stamps timers and scores guesses, rng picks
+        # words, turn order and colors. Round timers sleep on the event loop, so a
+        # clock other than time.time needs a loop keeping the same time (simulate.py).
+        self.clock = clock
+        self.rng = rng or random.Random()
+
         # active_connections: room_id -> {client_id -> WebSocket}
         self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
         
-        # rooms: room_id -> Room Data
-        self.rooms: Dict[str, dict] = {}
+        # rooms: room_id -> Room
+        self.rooms: Dict[str, Room] = {}
+
+        # Spectator tier: spectators are kept out of active_connections, so they
+        # cost nothing per broadcast. Room messages are queued pre-serialized and
+        # flushed to all spectators as one shared BATCH every SPECTATOR_FLUSH_INTERVAL.
+        # spectators: room_id -> {client_id -> WebSocket}
+        self.spectators: Dict[str, Dict[str, WebSocket]] = {}
+        # spectator_buffers: room_id -> [serialized message, ...]
+        self.spectator_buffers: Dict[str, List[str]] = {}
+
+        # Game recordings (REPLAY_DIR): room_id -> recorder of the game in progress.
+        # Finished recorders wait in closing_recorders for their last flush.
+        self.recorders: Dict[str, replay.GameRecorder] = {}
+        self.closing_recorders: List[replay.GameRecorder] = []
+
+        # Heartbeats, for players and spectators alike:
+        # room_id -> {client_id -> {"last_seen": monotonic time, "rtt": seconds or None}}
+        self.heartbeats: Dict[str, Dict[str, dict]] = {}
+
+        # Room actors: every input for a room (socket messages, round timers, reaping)
+        # goes through its inbox and is handled one at a time by that room's task,
+        # so handlers for the same room never interleave across awaits.
+        # inboxes: room_id -> Queue of (handler, args); actors: room_id -> Task
+        self.inboxes: Dict[str, asyncio.Queue] = {}
+        self.actors: Dict[str, asyncio.Task] = {}
+        # While an actor handles a batch, coalesced broadcasts wait here:
+        # room_id -> [(message, exclude_client), ...]
+        self.batching: set = set()
+        self.coalesced: Dict[str, list] = {}
+
+        # Clients being sent a stroke history too big to encode on the loop. Room messages
+        # skip them until it's sent, then follow from the outbox.
+        # preparing: room_id -> {client_id -> Task}
+        self.preparing: Dict[str, Dict[str, asyncio.Task]] = {}
+
+        # Payloads shared by everyone who (re)joins a game until the room changes, so a
+        # burst of reconnects serializes the state and the stroke history once.
+        # state_cache: room_id -> (room seq, GAME_STATE_UPDATE text without the drawer's word)
+        # history_cache: room_id -> Future of the stroke history as JSON
+        self.state_cache: Dict[str, tuple] = {}
+        # roster_cache: room_id -> (roster version, player_list snapshot)
+        self.roster_cache: Dict[str, tuple] = {}
+        self.history_cache: Dict[str, asyncio.Future] = {}
+        # Joins announced within JOIN_COALESCE_WINDOW of the last announcement wait here
+        # for one PLAYERS_JOINED: room_id -> [nickname, ...]
+        self.join_windows: Dict[str, List[str]] = {}
+        # Config changes waiting for the end of their CONFIG_COALESCE_WINDOW: room_id -> {key: value}
+        self.pending_config: Dict[str, dict] = {}
+
+        # round_timers: room_id -> the task ending the current round, so a drain can pause it.
+        # Once draining, no rooms are created and sockets get no further (see drain).
+        self.round_timers: Dict[str, asyncio.Task] = {}
+        self.draining = False
 
     async def connect(self, websocket: WebSocket, room_id: str, client_id: str):
         await websocket.accept()
         if room_id not in self.active_connections:
             self.active_connections[room_id] = {}
         self.active_connections[room_id][client_id] = websocket
+        self.heartbeats.setdefault(room_id, {})[client_id] = {"last_seen": time.monotonic(), "rtt": None}
         
         # Room is not empty anymore
         if room_id in self.rooms:
-            self.rooms[room_id]["empty_since"] = None
+            self.rooms[room_id].empty_since = None
+
+    def disconnect(self, room_id: str, client_id: str, websocket: WebSocket = None) -> bool:
+        """
+        Returns False, and leaves everything alone, if websocket is given but the
+        client has since reconnected on another socket.
+        """
+        current = self.active_connections.get(room_id, {}).get(client_id) or self.spectators.get(room_id, {}).get(client_id)
+        if websocket is not None and current is not None and current is not websocket:
+            return False
+        beats = self.heartbeats.get(room_id)
+        if beats is not None:
+            beats.pop(client_id, None)
+            if not beats:
+                del self.heartbeats[room_id]
+        self.stop_history_transfer(room_id, client_id)
+
+        if client_id in self.spectators.get(room_id, {}):
+            del self.spectators[room_id][client_id]
+            if not self.spectators[room_id]:
+                del self.spectators[room_id]
+                self.spectator_buffers.pop(room_id, None)
+            return True
 
-    def disconnect(self, room_id: str, client_id: str):
         if room_id in self.active_connections:
             if client_id in self.active_connections[room_id]:
                 del self.active_connections[room_id][client_id]
@@ -33,84 +206,585 @@ class ConnectionManager:
             # Update player status to disconnected
             if room_id in self.rooms:
                 room = self.rooms[room_id]
-                for nickname, p_data in room["players"].items():
-                    if p_data["client_id"] == client_id:
-                        p_data["connected"] = False
+                for nickname, p_data in room.players.items():
+                    if p_data.client_id == client_id:
+                        p_data.connected = False
+                        room.roster_changed(p_data)
                         break
                 
                 # Check if room is empty
                 if not self.active_connections.get(room_id):
-                    room["empty_since"] = time.time()
+                    room.empty_since = self.clock()
+        return True
+
+    # --- Heartbeats ---
+
+    def touch(self, room_id: str, client_id: str):
+        # Any inbound message proves the socket is alive
+        beat = self.heartbeats.get(room_id, {}).get(client_id)
+        if beat is not None:
+            beat["last_seen"] = time.monotonic()
+
+    def record_pong(self, room_id: str, client_id: str, sent):
+        beat = self.heartbeats.get(room_id, {}).get(client_id)
+        if beat is None or not isinstance(sent, (int, float)):
+            return
+        rtt = time.monotonic() - sent
+        if 0 <= rtt < HEARTBEAT_TIMEOUT:
+            beat["rtt"] = rtt
+            metrics.client_rtt_seconds.observe(rtt)
+
+    async def send_heartbeats(self):
+        """One sweep over every socket: reap the silent ones, PING the rest."""
+        now = time.monotonic()
+        # PONG echoes t back, so the RTT needs no per-client state at send time
+        text = json.dumps({"type": "PING", "payload": {"t": now}})
+        dead = []
+        for room_id, beats in list(self.heartbeats.items()):
+            for client_id, beat in list(beats.items()):
+                if now - beat["last_seen"] > HEARTBEAT_TIMEOUT:
+                    dead.append((room_id, client_id))
+                    continue
+                connection = self.active_connections.get(room_id, {}).get(client_id) or self.spectators.get(room_id, {}).get(client_id)
+                if connection is None:
+                    continue
+                try:
+                    await connection.send_text(text)
+                except Exception:
+                    dead.append((room_id, client_id))
+        for room_id, client_id in dead:
+            if room_id in self.rooms:
+                await self.submit(room_id, self.reap, room_id, client_id)
+            else:
+                self.disconnect(room_id, client_id)
+
+    async def heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            await self.send_heartbeats()
+
+    async def reap(self, room_id: str, client_id: str):
+        connection = self.active_connections.get(room_id, {}).get(client_id) or self.spectators.get(room_id, {}).get(client_id)
+        room = self.rooms.get(room_id)
+        nickname = None
+        if room and client_id in self.active_connections.get(room_id, {}):
+            nickname = next((p.nickname for p in room.players.values() if p.client_id == client_id), None)
+        self.disconnect(room_id, client_id)
+        metrics.heartbeat_reaped.inc()
+        logger.info(f"Reaped silent client {client_id} in room {room_id}")
+        if nickname:
+            await self.broadcast(room_id, {
+                "type": "PLAYER_DISCONNECTED",
+                "payload": {"nickname": nickname, "roster_version": room.roster_version}
+            })
+        if connection is not None:
+            # The close handshake can take a while on a half-open socket; don't hold up the sweep.
+            # 4001 tells a client that was merely quiet to reconnect.
+            asyncio.create_task(self._close_quietly(connection, 4001))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int, reason: str = None):
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def client_report(self, room_id: str) -> List[dict]:
+        now = time.monotonic()
+        room = self.rooms.get(room_id)
+        nicknames = {p.client_id: p.nickname for p in room.players.values()} if room else {}
+        return [{
+            "client_id": client_id,
+            "nickname": nicknames.get(client_id),
+            "spectator": client_id in self.spectators.get(room_id, {}),
+            "rtt_ms": round(beat["rtt"] * 1000, 1) if beat["rtt"] is not None else None,
+            "idle_seconds": round(now - beat["last_seen"], 1)
+        } for client_id, beat in self.heartbeats.get(room_id, {}).items()]
     
     async def broadcast(self, room_id: str, message: dict, exclude_client: str = None):
-        if room_id in self.active_connections:
+        if room_id in self.batching and message["type"] in COALESCED_TYPES:
+            self.coalesced.setdefault(room_id, []).append((message, exclude_client))
+            return
+        await self.broadcast_encoded(room_id, message["type"], json.dumps(message["payload"]), exclude_client)
+
+    async def broadcast_encoded(self, room_id: str, msg_type: str, payload: str, exclude_client: str = None):
+        """broadcast() for a payload that is already JSON."""
+        if self.coalesced.get(room_id):
+            await self.flush_coalesced(room_id) # Keep room messages in order
+        room = self.rooms.get(room_id)
+        if room_id in self.active_connections or room is not None:
+            started = time.perf_counter()
+            # Serialized once for the whole room. Sequenced and kept for resume
+            # even when nobody is connected to receive it.
+            if room is not None:
+                room.seq += 1
+                text = f'{{"type": "{msg_type}", "payload": {payload}, "seq": {room.seq}}}'
+                room.add_to_outbox((room.seq, text, exclude_client, None))
+            else:
+                text = f'{{"type": "{msg_type}", "payload": {payload}}}'
+            sent = 0
             broken_clients = []
-            for client_id, connection in self.active_connections[room_id].items():
-                if client_id == exclude_client:
+            # Clients still being sent a big history get these afterwards, from the outbox
+            preparing = self.preparing.get(room_id, ())
+            # Snapshot: joins and disconnects can change the dict while we await sends
+            for client_id, connection in list(self.active_connections.get(room_id, {}).items()):
+                if client_id == exclude_client or client_id in preparing:
                     continue
                 try:
-                    await connection.send_text(json.dumps(message))
+                    await connection.send_text(text)
+                    sent += 1
                 except Exception:
                     broken_clients.append(client_id)
             
             for client_id in broken_clients:
                 self.disconnect(room_id, client_id)
 
+            if room_id in self.spectators:
+                self.spectator_buffers.setdefault(room_id, []).append(text)
+            recorder = self.recorders.get(room_id)
+            if recorder:
+                recorder.record(text)
+
+            metrics.messages_sent.inc(msg_type, amount=sent)
+            metrics.bytes_sent.inc(msg_type, amount=sent * len(text))
+            duration = time.perf_counter() - started
+            metrics.broadcast_seconds.observe(duration)
+            check_slow("broadcast", duration, room_id, msg_type, len(text))
+            flight.record(room_id, "out", msg_type, len(text), duration, sent)
+
+    async def flush_coalesced(self, room_id: str):
+        pending = self.coalesced.pop(room_id, [])
+        # Runs of messages with the same recipients become one BATCH
+        i = 0
+        while i < len(pending):
+            exclude_client = pending[i][1]
+            j = i
+            while j < len(pending) and pending[j][1] == exclude_client:
+                j += 1
+            messages = [m for m, _ in pending[i:j]]
+            # Straight to broadcast_encoded: broadcast() would queue them again while the room is batching
+            if len(messages) == 1:
+                await self.broadcast_encoded(room_id, messages[0]["type"], json.dumps(messages[0]["payload"]), exclude_client)
+            else:
+                await self.broadcast_encoded(room_id, "BATCH", json.dumps({"messages": messages}), exclude_client)
+            i = j
+
+    # --- Room actors ---
+
+    async def submit(self, room_id: str, handler, *args) -> bool:
+        """
+        Queue handler(*args) on the room's actor. Waits only while the inbox is full.
+        Returns False, queueing nothing, if the room is gone.
+        """
+        room = self.rooms.get(room_id)
+        if room is None:
+            return False
+        room.active_at = self.clock()
+        await self._enqueue(room_id, handler, args)
+        return True
+
+    async def _enqueue(self, room_id: str, handler, args: tuple):
+        # submit() without counting as activity
+        inbox = self.inboxes.get(room_id)
+        if inbox is None:
+            inbox = self.inboxes[room_id] = asyncio.Queue(ROOM_INBOX_SIZE)
+            self.actors[room_id] = asyncio.create_task(self._run_room(room_id, inbox))
+        await inbox.put((handler, args))
+
+    def inbox_depth(self, room_id: str) -> int:
+        inbox = self.inboxes.get(room_id)
+        return inbox.qsize() if inbox is not None else 0
+
+    async def settle(self, room_id: str):
+        """Wait until everything queued for the room so far has been handled."""
+        inbox = self.inboxes.get(room_id)
+        if inbox is not None:
+            await inbox.join()
+
+    async def _run_room(self, room_id: str, inbox: asyncio.Queue):
+        try:
+            while room_id in self.rooms:
+                batch = [await inbox.get()]
+                # Take whatever else is already waiting, so its broadcasts can be coalesced
+                while len(batch) < ROOM_BATCH_SIZE and not inbox.empty():
+                    batch.append(inbox.get_nowait())
+                metrics.room_batch_size.observe(len(batch))
+                room = self.rooms.get(room_id)
+                if room is not None and room.hibernated is not None:
+                    self.wake_room(room)
+                if len(batch) > 1:
+                    self.batching.add(room_id)
+                try:
+                    for item in batch:
+                        if item is STOP:
+                            break
+                        handler, args = item
+                        started = time.perf_counter()
+                        try:
+                            await handler(*args)
+                        except asyncio.CancelledError:
+                            # Only the actor itself being cancelled stops it; a handler whose
+                            # awaited job was cancelled (offload.cancel) just failed
+                            if asyncio.current_task().cancelling():
+                                raise
+                            logger.warning(f"Room {room_id}: {getattr(handler, '__name__', handler)} was cancelled")
+                        except Exception:
+                            logger.exception(f"Room {room_id}: {getattr(handler, '__name__', handler)} failed")
+                        flight.record(
+                            room_id, "run", getattr(handler, "__name__", "?"), 0, time.perf_counter() - started, inbox.qsize()
+                        )
+                    self.batching.discard(room_id)
+                    if self.coalesced.get(room_id):
+                        await self.flush_coalesced(room_id)
+                finally:
+                    self.batching.discard(room_id)
+                    for _ in batch:
+                        inbox.task_done()
+                if room is not None and room.hibernated is not None and inbox.empty():
+                    break # Asleep: the next submit starts a new actor
+        finally:
+            if self.actors.get(room_id) is asyncio.current_task():
+                del self.actors[room_id]
+                del self.inboxes[room_id]
+            self.coalesced.pop(room_id, None)
+            # Room is gone: drop what's left and unblock anyone waiting to put or join
+            while not inbox.empty():
+                inbox.get_nowait()
+                inbox.task_done()
+
+    # --- Hibernation ---
+
+    def can_hibernate(self, room_id: str, room: Room) -> bool:
+        # No game running (so no timers), no input for HIBERNATE_AFTER, and nothing in flight
+        gs = room.game_state
+        return (
+            room.hibernated is None
+            and (gs is None or gs.phase == "GAME_OVER")
+            and self.clock() - room.active_at >= HIBERNATE_AFTER
+            and not self.inbox_depth(room_id)
+            and not self.preparing.get(room_id)
+            and room_id not in self.join_windows
+            and room_id not in self.pending_config
+            and room_id not in self.recorders
+        )
+
+    async def hibernate_idle_rooms(self):
+        if HIBERNATE_AFTER <= 0:
+            return
+        for room_id, room in list(self.rooms.items()):
+            if self.can_hibernate(room_id, room):
+                await self._enqueue(room_id, self.hibernate_room, (room_id,))
+
+    async def hibernate_room(self, room_id: str):
+        """
+        Compress the room's game state and resume buffer until its next input, which
+        wakes it on the actor (wake_room). Players, config and the rest stay as they are,
+        so the lobby list, disconnects and sessions holding the Room don't notice.
+        """
+        room = self.rooms.get(room_id)
+        if room is None or not self.can_hibernate(room_id, room):
+            return
+        gs, entries = room.game_state, list(room.outbox)
+        if gs is not None and gs.history_bytes > OFFLOAD_MIN_BYTES:
+            frozen = await offload.run(room_id, "hibernate", freeze_room, gs, entries)
+            if self.rooms.get(room_id) is not room:
+                return
+        else:
+            frozen = freeze_room(gs, entries)
+        # Broadcasts made meanwhile (a reaped player, say) stay in the outbox; wake_room puts them back in order
+        last_seq = entries[-1][0] if entries else 0
+        room.replace_outbox(deque((e for e in room.outbox if e[0] > last_seq), maxlen=RESUME_BUFFER_SIZE))
+        room.game_state = None
+        room.hibernated = frozen
+        for p in room.players.values():
+            p.view_json = None
+        self.drop_caches(room_id)
+        metrics.rooms_hibernated.inc()
+
+    def wake_room(self, room: Room):
+        game_state, entries = thaw_room(room.hibernated)
+        entries.extend(room.outbox)
+        room.game_state = game_state
+        room.replace_outbox(deque(entries, maxlen=RESUME_BUFFER_SIZE))
+        room.hibernated = None
+        metrics.rooms_woken.inc()
+
+    def hibernated_count(self) -> int:
+        return sum(1 for room in self.rooms.values() if room.hibernated is not None)
+
+    # --- Drain and handoff (see handoff.py) ---
+
+    async def drain(self) -> dict:
+        """
+        Stop taking rooms and input, pause round timers, write the rooms for the next
+        process (with HANDOFF_DIR set) and close every socket with 1012 so clients reconnect.
+        """
+        if self.draining:
+            return {"rooms": len(self.rooms), "file": None}
+        self.draining = True
+        started = time.perf_counter()
+        for task in list(self.round_timers.values()):
+            task.cancel()
+        # Pending config changes would otherwise be lost; then let the actors finish what's queued
+        for room_id in list(self.pending_config):
+            await self.submit(room_id, self.flush_config, room_id)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(self.settle(r) for r in list(self.inboxes))), DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Draining: rooms still busy after {DRAIN_TIMEOUT}s, saving them as they are")
+
+        path = None
+        if handoff.enabled():
+            snapshot = {
+                "version": handoff.VERSION,
+                "drained_at": self.clock(),
+                "rooms": [room_to_fields(room) for room in self.rooms.values()],
+            }
+            data = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+            await asyncio.to_thread(handoff.write, data)
+            path = handoff.path()
+            logger.info(f"Drained {len(self.rooms)} rooms ({len(data)} bytes) to {path}")
+
+        # 1012: service restart. The retry-after spreads the reconnects out, as after a mass drop.
+        closing = []
+        for sockets in list(self.active_connections.values()) + list(self.spectators.values()):
+            for ws in list(sockets.values()):
+                closing.append(self._close_quietly(ws, 1012, f"retry-after={admission.reconnect_delay()}"))
+        await asyncio.gather(*closing)
+        metrics.drain_seconds.set(time.perf_counter() - started)
+        return {"rooms": len(self.rooms), "file": path}
+
+    async def restore(self, snapshot: dict) -> int:
+        """
+        Take over rooms drained by the previous process. Everyone starts out disconnected
+        and resumes on reconnect; a round in progress gets back the time it had left.
+        """
+        now = self.clock()
+        paused = max(0.0, now - snapshot["drained_at"])
+        restored = 0
+        for values in snapshot["rooms"]:
+            room_id = values["id"]
+            if room_id in self.rooms or not sharding.is_local(room_id):
+                # WORKERS changed between the deploys; the room's new owner never sees it
+                logger.warning(f"Dropping handed-off room {room_id}: not on this worker")
+                continue
+            try:
+                room = room_from_fields(values)
+            except TypeError as e:
+                logger.warning(f"Dropping handed-off room {room_id}: {e}")
+                continue
+            for p in room.players.values():
+                p.connected = False
+            room.roster_changed(*room.players.values())
+            room.empty_since = room.active_at = now
+            self.rooms[room_id] = room
+            flight.open_room(room_id)
+            gs = room.game_state
+            if gs is not None and gs.phase == "DRAWING":
+                gs.timer_end += paused
+                self.start_round_timer(room_id, gs.timer_end - now)
+                # Into the outbox, so clients resuming from before the drain see the new timer_end
+                await self.broadcast_game_state(room_id)
+            restored += 1
+        metrics.rooms_restored.inc(amount=restored)
+        logger.info(f"Restored {restored} rooms, paused for {paused:.1f}s")
+        return restored
+
+    def stop_offloads(self, room_id: str):
+        for task in self.preparing.pop(room_id, {}).values():
+            task.cancel()
+        offload.cancel(room_id)
+
+    def drop_caches(self, room_id: str):
+        self.state_cache.pop(room_id, None)
+        self.roster_cache.pop(room_id, None)
+        self.history_cache.pop(room_id, None)
+        self.join_windows.pop(room_id, None)
+        self.pending_config.pop(room_id, None)
+
+    def stop_actor(self, room_id: str):
+        # Call once the room is deleted. The actor finishes the handler it is running,
+        # then stops and drops the rest of its inbox; a full inbox means it isn't
+        # waiting for input and will notice the room is gone after this batch anyway.
+        inbox = self.inboxes.get(room_id)
+        if inbox is not None:
+            try:
+                inbox.put_nowait(STOP)
+            except asyncio.QueueFull:
+                pass
+
+    def messages_since(self, room_id: str, client_id: str, nickname: str, seq: int) -> Optional[List[str]]:
+        """
+        Room messages after seq as this client saw them, or None if some have
+        already fallen out of the outbox and a full state transfer is needed.
+        """
+        room = self.rooms[room_id]
+        outbox = room.outbox
+        if seq > room.seq:
+            return None # Not from this room's lifetime
+        if seq == room.seq:
+            return []
+        if not outbox or outbox[0][0] > seq + 1:
+            return None
+        # Sequence numbers in the outbox are contiguous
+        texts = []
+        for _, text, exclude_client, private in islice(outbox, seq + 1 - outbox[0][0], None):
+            if exclude_client == client_id:
+                continue
+            texts.append(private.get(nickname, text) if private else text)
+        return texts
+
     async def send_to_client(self, room_id: str, client_id: str, message: dict):
-        if room_id in self.active_connections and client_id in self.active_connections[room_id]:
+        await self.send_text_to_client(room_id, client_id, json.dumps(message), message["type"])
+
+    async def send_text_to_client(self, room_id: str, client_id: str, text: str, msg_type: str):
+        if self.coalesced.get(room_id):
+            await self.flush_coalesced(room_id) # Don't overtake room messages queued before us
+        connection = self.active_connections.get(room_id, {}).get(client_id)
+        if connection is None:
+            connection = self.spectators.get(room_id, {}).get(client_id)
+        if connection is not None:
+            started = time.perf_counter()
             try:
-                await self.active_connections[room_id][client_id].send_text(json.dumps(message))
+                await connection.send_text(text)
             except Exception:
                 self.disconnect(room_id, client_id)
+                return
+            metrics.messages_sent.inc(msg_type)
+            metrics.bytes_sent.inc(msg_type, amount=len(text))
+            flight.record(room_id, "out", msg_type, len(text), time.perf_counter() - started, 1)
 
     def create_room(self, room_name: str, password: Optional[str] = None, game_type: str = "drawing", config: dict = None) -> str:
-        # Enforce unique room names
-        for r in self.rooms.values():
-            if r["name"].lower() == room_name.lower():
+        if not room_name.strip() or len(room_name) > MAX_ROOM_NAME_LENGTH:
+            raise ValueError(f"Room name must be 1-{MAX_ROOM_NAME_LENGTH} characters.")
+        if MAX_ROOMS and len(self.rooms) >= MAX_ROOMS:
+            raise admission.AtCapacity("The server is full. Please try again later.", "rooms")
+        if admission.shedding():
+            raise admission.AtCapacity("The server is busy. Please try again in a moment.", "overloaded")
+        if self.draining:
+            raise admission.AtCapacity("The server is restarting. Please try again in a moment.", "draining")
+
+        # Enforce unique room names (rooms on other workers come from the backplane)
+        names = [r.name for r in self.rooms.values()] + [r["name"] for r in sharding.backplane.all_remote_rooms()]
+        for name in names:
+            if name.lower() == room_name.lower():
                 raise ValueError(f"Room name '{room_name}' is already taken.")
-                
+
+        # Pick an id that hashes to this worker so the room never has to move
         room_id = str(uuid.uuid4())[:8]
+        while not sharding.is_local(room_id):
+            room_id = str(uuid.uuid4())[:8]
         
-        # Default config if not provided
-        if config is None:
-            from constants import WORD_SETS
-            default_lang = next(iter(WORD_SETS.keys()))
-            default_diff = next(iter(WORD_SETS[default_lang].keys()))
-            config = {
-                "round_duration": 60,
-                "points_to_win": 50,
-                "base_points": 10,
-                "turn_order": "sequence",
-                "host_plays": True,
-                "word_language": default_lang,
-                "word_difficulty": default_diff
-            }
+        # GameConfig defaults for whatever isn't given
+        from constants import WORD_SETS
+        config = merge_config(GameConfig().dict(), config or {})
+        default_lang = next(iter(WORD_SETS.keys()))
+        config["word_language"] = config["word_language"] or default_lang
+        if config["word_difficulty"] is None:
+            config["word_difficulty"] = next(iter(WORD_SETS.get(config["word_language"], WORD_SETS[default_lang]).keys()))
 
         hashed_password = None
         if password:
             hashed_password = hashlib.sha256(password.encode()).hexdigest()
 
-        self.rooms[room_id] = {
-            "id": room_id,
-            "name": room_name,
-            "password": hashed_password,
-            "room_token": secrets.token_urlsafe(16),
-            "game_type": game_type,
-            "config": config,
-            "players": {}, # nickname -> { client_id, is_host, connected }
-            "state": "lobby",
-            "empty_since": time.time() # Created empty, waiting for host to connect
-        }
+        self.rooms[room_id] = Room(
+            id=room_id,
+            name=room_name,
+            password=hashed_password,
+            room_token=secrets.token_urlsafe(16),
+            game_type=game_type,
+            config=config,
+            outbox=deque(maxlen=RESUME_BUFFER_SIZE),
+            empty_since=self.clock(), # Created empty, waiting for host to connect
+            active_at=self.clock()
+        )
+        flight.open_room(room_id)
         return room_id
     
-    def update_game_config(self, room_id: str, config: dict):
-        if room_id in self.rooms:
-            # Merge updates
-            self.rooms[room_id]["config"].update(config)
+    async def update_game_config(self, room_id: str, config: dict):
+        """
+        Queues a host's config changes. Those made within CONFIG_COALESCE_WINDOW of the
+        first pending one go out together, validated, as one CONFIG_UPDATE.
+        """
+        if room_id not in self.rooms:
+            return
+        pending = self.pending_config.get(room_id)
+        if pending is None:
+            pending = self.pending_config[room_id] = {}
+            if CONFIG_COALESCE_WINDOW > 0:
+                asyncio.create_task(self._close_config_window(room_id))
+        pending.update((key, config[key]) for key in CONFIG_KEYS if key in config)
+        if CONFIG_COALESCE_WINDOW <= 0:
+            await self.flush_config(room_id)
+
+    async def _close_config_window(self, room_id: str):
+        await asyncio.sleep(CONFIG_COALESCE_WINDOW)
+        await self.submit(room_id, self.flush_config, room_id)
+
+    async def flush_config(self, room_id: str):
+        """Applies pending config changes and broadcasts the result, if any are pending."""
+        changes = self.pending_config.pop(room_id, None)
+        room = self.rooms.get(room_id)
+        if changes is None or room is None:
+            return
+        room.config = merge_config(room.config, changes)
+        room.config_version += 1
+        # Sent even if nothing changed: a host whose change was rejected gets its controls reset
+        await self.broadcast(room_id, {
+            "type": "CONFIG_UPDATE",
+            "payload": {"config": room.config, "version": room.config_version}
+        })
 
-    def get_room(self, room_id: str):
+    def get_room(self, room_id: str) -> Optional[Room]:
         return self.rooms.get(room_id)
 
+    def player_list(self, room_id: str) -> List[dict]:
+        return self.rooms[room_id].player_list()
+
+    def roster_json(self, room_id: str) -> str:
+        """The roster snapshot as JSON, reused as is until the roster changes."""
+        room = self.rooms[room_id]
+        cached = self.roster_cache.get(room_id)
+        if cached is None or cached[0] != room.roster_version:
+            cached = self.roster_cache[room_id] = (room.roster_version, room.roster_json())
+        return cached[1]
+
+    def join_success_text(self, room_id: str, payload: dict) -> str:
+        """
+        JOIN_SUCCESS with the roster snapshot spliced in as payload["players"]. Clients then
+        follow roster messages stamped with a roster_version newer than the snapshot's.
+        """
+        payload = dict(payload, roster_version=self.rooms[room_id].roster_version)
+        return f'{{"type": "JOIN_SUCCESS", "payload": {{"players": {self.roster_json(room_id)}, {json.dumps(payload)[1:]}}}'
+
+    def roster_text(self, room_id: str) -> str:
+        room = self.rooms[room_id]
+        return f'{{"type": "ROSTER", "payload": {{"players": {self.roster_json(room_id)}, "roster_version": {room.roster_version}}}}}'
+
+    async def broadcast_scores(self, room_id: str, nicknames):
+        """Score changes go out as one roster delta, for just the players whose score changed."""
+        room = self.rooms[room_id]
+        players = [{"nickname": n, "score": room.players[n].score} for n in nicknames]
+        if players:
+            room.roster_changed(*(room.players[n] for n in nicknames))
+            await self.broadcast(room_id, {
+                "type": "PLAYERS_UPDATE",
+                "payload": {"players": players, "roster_version": room.roster_version}
+            })
+
+    def public_rooms(self) -> List[dict]:
+        return [{
+            "id": r_data.id,
+            "name": r_data.name,
+            "has_password": bool(r_data.password),
+            "players_count": sum(1 for p in r_data.players.values() if p.connected),
+            "spectators_count": len(self.spectators.get(r_data.id, ()))
+        } for r_data in self.rooms.values()]
+
+    def list_rooms(self) -> List[dict]:
+        # Local rooms plus whatever the other workers last published
+        return self.public_rooms() + sharding.backplane.all_remote_rooms()
+
     def get_word_set_metadata(self) -> dict:
         from constants import WORD_SETS, LANGUAGE_METADATA
         metadata = {"languages": {}, "difficulties": {}}
@@ -119,14 +793,107 @@ class ConnectionManager:
             metadata["difficulties"][lang] = list(diffs.keys())
         return metadata
     
+    def add_spectator(self, room_id: str, client_id: str, password: Optional[str] = None, token: Optional[str] = None) -> str:
+        """
+        Moves an accepted socket to the spectator tier.
+        Returns "OK", "WRONG_PASSWORD" or "OVERLOADED". Spectators may join at any time.
+        """
+        room = self.rooms.get(room_id)
+        if not room:
+            return "ERROR"
+        if admission.shedding():
+            metrics.admission_rejected.inc("overloaded")
+            return "OVERLOADED"
+        if room.password is not None and not (token and token == room.room_token):
+            hashed_input = hashlib.sha256(password.encode()).hexdigest() if password else ""
+            if room.password != hashed_input:
+                return "WRONG_PASSWORD"
+
+        websocket = self.active_connections.get(room_id, {}).pop(client_id, None)
+        if websocket is None:
+            return "ERROR"
+        self.spectators.setdefault(room_id, {})[client_id] = websocket
+        # Spectators alone don't keep a room alive
+        if not self.active_connections.get(room_id):
+            room.empty_since = self.clock()
+        return "OK"
+
+    async def flush_spectators(self):
+        for room_id, buffer in list(self.spectator_buffers.items()):
+            if not buffer:
+                continue
+            self.spectator_buffers[room_id] = []
+            text = batch_text(buffer)
+            started = time.perf_counter()
+            sent = 0
+            broken_clients = []
+            preparing = self.preparing.get(room_id, ())
+            for client_id, connection in list(self.spectators.get(room_id, {}).items()):
+                if client_id in preparing:
+                    continue
+                try:
+                    await connection.send_text(text)
+                    sent += 1
+                except Exception:
+                    broken_clients.append(client_id)
+            for client_id in broken_clients:
+                self.disconnect(room_id, client_id)
+            metrics.messages_sent.inc("BATCH", amount=sent)
+            metrics.bytes_sent.inc("BATCH", amount=sent * len(text))
+            flight.record(room_id, "out", "SPECTATOR_BATCH", len(text), time.perf_counter() - started, sent)
+
+    async def spectator_flush_loop(self):
+        while True:
+            await asyncio.sleep(SPECTATOR_FLUSH_INTERVAL)
+            await self.flush_spectators()
+
+    async def close_spectators(self, room_id: str):
+        self.spectator_buffers.pop(room_id, None)
+        for ws in list(self.spectators.pop(room_id, {}).values()):
+            try:
+                await ws.close()
+            except Exception:
+                pass
+
+    def start_recording(self, room_id: str):
+        if replay.enabled():
+            self.stop_recording(room_id)
+            self.recorders[room_id] = replay.GameRecorder(room_id, self.clock)
+
+    def stop_recording(self, room_id: str):
+        recorder = self.recorders.pop(room_id, None)
+        if recorder:
+            recorder.closed = True
+            self.closing_recorders.append(recorder)
+
+    async def flush_recordings(self):
+        closing, self.closing_recorders = self.closing_recorders, []
+        for recorder in list(self.recorders.values()) + closing:
+            try:
+                await recorder.flush()
+            except OSError as e:
+                # Live play goes on without the recording
+                logger.warning(f"Dropping recording {recorder.game_id}: {e}")
+                self.recorders = {r: rec for r, rec in self.recorders.items() if rec is not recorder}
+
+    async def replay_flush_loop(self):
+        while True:
+            await asyncio.sleep(REPLAY_FLUSH_INTERVAL)
+            await self.flush_recordings()
+
     def try_join_room(self, room_id: str, client_id: str, nickname: str, password: Optional[str] = None, token: Optional[str] = None) -> str:
         """
         Returns "OK" if joined/reconnected.
         Returns "TAKEN" if nickname is taken by a connected player.
         Returns "WRONG_PASSWORD" if password does not match.
+        Returns "INVALID_NICKNAME" if nickname is empty or too long.
+        Returns "ROOM_FULL" or "OVERLOADED" for new players turned away by admission control.
         """
         if room_id not in self.rooms:
              return "ERROR"
+
+        if not isinstance(nickname, str) or not nickname.strip() or len(nickname) > MAX_NICKNAME_LENGTH:
+            return "INVALID_NICKNAME"
         
         room = self.rooms[room_id]
         
@@ -140,10 +907,10 @@ class ConnectionManager:
         # BUT what if someone steals nickname?
         # For simplicity, ALWAYS check password if room has it.
         
-        requires_password = room["password"] is not None
+        requires_password = room.password is not None
         if requires_password:
              # If valid token provided, skip password check
-             if token and token == room.get("room_token"):
+             if token and token == room.room_token:
                  pass # Token auth success
              else:
                  if not password:
@@ -153,81 +920,126 @@ class ConnectionManager:
                      pass # We'll enforce it.
                  
                  hashed_input = hashlib.sha256(password.encode()).hexdigest() if password else ""
-                 if room["password"] != hashed_input:
+                 if room.password != hashed_input:
                      # Exception: If I am already in players list? 
                      # Maybe we allow reconnects without password if we assume session persistence?
                      # The prompt says "joining room with password", implying initial join.
                      # Let's check logic:
-                     if nickname in room["players"]:
+                     if nickname in room.players:
                           # If trying to steal valid player, you need password too?
                           # Yes.
                           return "WRONG_PASSWORD"
                      
                      return "WRONG_PASSWORD"
 
-        if nickname in room["players"]:
-            existing = room["players"][nickname]
-            if existing["connected"]:
+        if nickname in room.players:
+            existing = room.players[nickname]
+            if existing.connected:
                 return "TAKEN"
                 
             # Reconnection: Update client_id to the new connection
             # If we reached here, password was correct or not required
-            existing["client_id"] = client_id
-            existing["connected"] = True
+            existing.client_id = client_id
+            existing.connected = True
+            room.roster_changed(existing)
             return "OK"
         else:
             # New join - only allowed in lobby
-            if room["state"] != "lobby":
+            if room.state != "lobby":
                 return "GAME_STARTED"
+            # Reconnects above are always let in, so games in progress survive overload
+            if MAX_PLAYERS_PER_ROOM and len(room.players) >= MAX_PLAYERS_PER_ROOM:
+                metrics.admission_rejected.inc("room_full")
+                return "ROOM_FULL"
+            if admission.shedding():
+                metrics.admission_rejected.inc("overloaded")
+                return "OVERLOADED"
                 
-            is_first = len(room["players"]) == 0
+            is_first = len(room.players) == 0
             
             from constants import COLORS
-            import random
             
-            # Find used colors
-            used_colors = {p.get("color") for p in room["players"].values() if p.get("color")}
-            available_colors = [c for c in COLORS if c not in used_colors]
+            # Find used colors; in a room bigger than the palette they are all taken anyway
+            available_colors = []
+            if len(room.players) < len(COLORS):
+                used_colors = {p.color for p in room.players.values() if p.color}
+                available_colors = [c for c in COLORS if c not in used_colors]
             
             if available_colors:
-                color = random.choice(available_colors)
+                color = self.rng.choice(available_colors)
             else:
-                color = random.choice(COLORS) # Fallback if all taken
+                color = self.rng.choice(COLORS) # Fallback if all taken
             
-            import time
-            room["empty_since"] = None # Ensure it is not marked empty
-
-            room["players"][nickname] = {
-                "client_id": client_id, 
-                "is_host": is_first, 
-                "connected": True,
-                "is_ready": False,
-                "score": 0,
-                "color": color
-            }
+            room.empty_since = None # Ensure it is not marked empty
+
+            room.players[nickname] = Player(nickname, client_id, is_host=is_first, color=color)
+            room.roster_changed()
             return "OK"
 
+    async def announce_join(self, room_id: str, nickname: str):
+        """
+        Tells the room about a join with PLAYER_JOINED. Joins following close behind
+        it, as after a mass reconnect, are announced together in one PLAYERS_JOINED.
+        """
+        room = self.rooms[room_id]
+        pending = self.join_windows.get(room_id)
+        if pending is not None:
+            pending.append(nickname)
+            return
+        await self.broadcast(room_id, {
+            "type": "PLAYER_JOINED",
+            "payload": dict(room.players[nickname].view(), total_players=len(room.players), roster_version=room.roster_version)
+        })
+        if JOIN_COALESCE_WINDOW > 0:
+            self.join_windows[room_id] = []
+            asyncio.create_task(self._close_join_window(room_id))
+
+    async def _close_join_window(self, room_id: str):
+        await asyncio.sleep(JOIN_COALESCE_WINDOW)
+        await self.submit(room_id, self._flush_joins, room_id)
+
+    async def _flush_joins(self, room_id: str):
+        pending = self.join_windows.pop(room_id, None)
+        room = self.rooms.get(room_id)
+        if not pending or room is None:
+            return
+        # Views as of now; whoever left meanwhile is skipped
+        players = [room.players[n].view() for n in dict.fromkeys(pending) if n in room.players]
+        if players:
+            # A version of its own: a roster change since the joins (a TOGGLE_READY, say) already
+            # went out stamped with the current one, and clients skip versions they have
+            room.roster_changed()
+            await self.broadcast(room_id, {
+                "type": "PLAYERS_JOINED",
+                "payload": {"players": players, "total_players": len(room.players), "roster_version": room.roster_version}
+            })
+        # Joins keep coming: hold the next ones for another window too
+        self.join_windows[room_id] = []
+        asyncio.create_task(self._close_join_window(room_id))
+
     def set_player_ready(self, room_id: str, nickname: str, is_ready: bool):
-        if room_id in self.rooms and nickname in self.rooms[room_id]["players"]:
-            self.rooms[room_id]["players"][nickname]["is_ready"] = is_ready
+        if room_id in self.rooms and nickname in self.rooms[room_id].players:
+            room = self.rooms[room_id]
+            room.players[nickname].is_ready = is_ready
+            room.roster_changed(room.players[nickname])
 
     def can_start_game(self, room_id: str) -> bool:
         room = self.rooms.get(room_id)
         if not room: return False
         
-        connected_players = [p for p in room["players"].values() if p["connected"]]
+        connected_players = [p for p in room.players.values() if p.connected]
         
         # Determine playing players
         playing_count = 0
         all_ready = True
         
-        host_plays = room["config"].get("host_plays", True)
+        host_plays = room.config.get("host_plays", True)
         
         for p in connected_players:
-            if p["is_host"] and not host_plays:
+            if p.is_host and not host_plays:
                 continue # Host is spectating
             playing_count += 1
-            if not p["is_ready"]:
+            if not p.is_ready:
                 all_ready = False
         
         if playing_count < 2:
@@ -235,34 +1047,23 @@ class ConnectionManager:
             
         return all_ready
 
+    @traced
     async def start_game(self, room_id: str):
         if room_id in self.rooms:
             room = self.rooms[room_id]
-            room["state"] = "playing"
+            room.state = "playing"
             
             # Initialize Game State
-            room["game_state"] = {
-                "round": 0,
-                "drawer": None,
-                "word": None,
-                "turn_queue": [],
-                "timer_end": 0,
-                "phase": "PRE_ROUND",
-                "current_word_obfuscated": "",
-                "correct_guessers": [],
-                "first_guess_time_left": 0,
-                "first_guesser_nickname": None,
-                "last_drawer": None,
-                "last_word": None,
-                "turn_results": {}, # nickname -> {points, time}
-                "stroke_history": [],
-                "used_words": set(),
-                "last_word_set": None # (language, difficulty)
-            }
+            room.game_state = GameState()
+            self.history_cache.pop(room_id, None)
             
             # Reset scores
-            for p in room["players"].values():
-                p["score"] = 0
+            reset = [n for n, p in room.players.items() if p.score]
+            for p in room.players.values():
+                p.score = 0
+            await self.broadcast_scores(room_id, reset)
+
+            self.start_recording(room_id)
 
             # Start first round
             await self.next_turn(room_id)
@@ -270,25 +1071,25 @@ class ConnectionManager:
     def _get_turn_queue(self, room):
         # Filter players based on host_plays
         candidates = []
-        host_plays = room["config"].get("host_plays", True)
+        host_plays = room.config.get("host_plays", True)
         
-        for n, p in room["players"].items():
-            if not p["connected"]: continue
-            if p["is_host"] and not host_plays: continue
+        for n, p in room.players.items():
+            if not p.connected: continue
+            if p.is_host and not host_plays: continue
             candidates.append(n)
             
-        import random
-        random.shuffle(candidates)
+        self.rng.shuffle(candidates)
         return candidates
+    @traced
     async def next_turn(self, room_id: str):
         room = self.rooms[room_id]
-        gs = room["game_state"]
+        gs = room.game_state
 
         # Win Condition Check (End of any round)
-        if gs["round"] > 0:
-            max_score_threshold = room["config"]["points_to_win"]
+        if gs.round > 0:
+            max_score_threshold = room.config["points_to_win"]
             # Check if any player reached the threshold
-            eligible_winners = [p for p in room["players"].values() if p["score"] >= max_score_threshold]
+            eligible_winners = [p for p in room.players.values() if p.score >= max_score_threshold]
             
             if eligible_winners:
                 # If multiple people crossed it, the one with the highest score wins.
@@ -297,26 +1098,30 @@ class ConnectionManager:
                 return
 
         # Check Turn Queue
-        if not gs["turn_queue"]:
-            gs["turn_queue"] = self._get_turn_queue(room)
+        if not gs.turn_queue:
+            gs.turn_queue = self._get_turn_queue(room)
 
-        if not gs["turn_queue"]:
+        if not gs.turn_queue:
              await self.end_game(room_id)
              return
 
         # Increment round for every new turn
-        gs["round"] += 1
+        gs.round += 1
+        recorder = self.recorders.get(room_id)
+        if recorder:
+            recorder.mark_round(gs.round)
+            # Scores and players only go out as deltas, so a replay seeking to this round starts from a snapshot
+            recorder.record(self.roster_text(room_id))
 
-        drawer = gs["turn_queue"].pop(0)
-        gs["drawer"] = drawer
+        drawer = gs.turn_queue.pop(0)
+        gs.drawer = drawer
         
         # Select Word
         from constants import WORD_SETS
-        import random
         
         default_lang = next(iter(WORD_SETS.keys()))
-        language = room["config"].get("word_language", default_lang)
-        difficulty = room["config"].get("word_difficulty") # Will fallback below
+        language = room.config.get("word_language", default_lang)
+        difficulty = room.config.get("word_difficulty") # Will fallback below
         
         # Fallback logic for language
         lang_set = WORD_SETS.get(language, WORD_SETS[default_lang])
@@ -328,195 +1133,274 @@ class ConnectionManager:
         
         # Non-repeating logic with set optimization
         current_set_id = (language, difficulty)
-        if gs.get("last_word_set") != current_set_id:
-            gs["used_words"] = set()
-            gs["last_word_set"] = current_set_id
+        if gs.last_word_set != current_set_id:
+            gs.used_words = set()
+            gs.last_word_set = current_set_id
 
-        # Use set exclusion for better performance
-        # available_words will be a list for random.choice
-        available_words = list(set(all_words) - gs["used_words"])
+        # Kept in word list order: a set's order changes with the hash seed, and the
+        # same rng seed has to pick the same words
+        available_words = [w for w in all_words if w not in gs.used_words]
         
         # Reset if all words used
         if not available_words:
-            gs["used_words"] = set()
+            gs.used_words = set()
             available_words = all_words
 
-        word = random.choice(available_words)
-        gs["used_words"].add(word)
-        gs["word"] = word
+        word = self.rng.choice(available_words)
+        gs.used_words.add(word)
+        gs.word = word
         # For hints, we use underscores for letters and space for spaces. 
         # Frontend will handle the rendering.
-        gs["current_word_obfuscated"] = "".join(["_" if c != " " else " " for c in word])
+        gs.current_word_obfuscated = "".join(["_" if c != " " else " " for c in word])
         
         # Transition to PREPARING (Manual Start)
-        gs["phase"] = "DRAWER_PREPARING"
-        gs["timer_end"] = 0 
-        gs["correct_guessers"] = []
-        gs["first_guess_time_left"] = 0
-        gs["stroke_history"] = []
+        gs.phase = "DRAWER_PREPARING"
+        gs.timer_end = 0 
+        gs.correct_guessers = []
+        gs.first_guess_time_left = 0
+        gs.stroke_history = []
+        gs.history_bytes = 0
+        gs.history_compacted = False
+        gs.history_full = False
+        self.history_cache.pop(room_id, None)
         
         await self.broadcast_game_state(room_id)
 
+    @traced
     async def start_active_round(self, room_id: str):
         room = self.rooms[room_id]
-        gs = room["game_state"]
-        if gs["phase"] != "DRAWER_PREPARING": return
-
-        import time
-        duration = room["config"]["round_duration"]
-        gs["timer_end"] = time.time() + duration
-        gs["phase"] = "DRAWING"
-        gs["turn_results"] = {} # Clear old results now that new one starts
+        gs = room.game_state
+        if gs.phase != "DRAWER_PREPARING": return
+
+        duration = room.config["round_duration"]
+        gs.timer_end = self.clock() + duration
+        gs.phase = "DRAWING"
+        gs.turn_results = {} # Clear old results now that new one starts
         
         await self.broadcast_game_state(room_id)
-        asyncio.create_task(self._round_timer(room_id, duration, gs["drawer"], gs["word"]))
+        self.start_round_timer(room_id, duration)
+
+    def start_round_timer(self, room_id: str, duration: float):
+        gs = self.rooms[room_id].game_state
+        self.round_timers[room_id] = asyncio.create_task(self._round_timer(room_id, duration, gs.drawer, gs.word))
+        metrics.round_timers_started.inc()
 
     async def _round_timer(self, room_id, duration, drawer, word):
-        await asyncio.sleep(duration)
+        metrics.round_timers_active.inc()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            metrics.round_timers_active.dec()
+            if self.round_timers.get(room_id) is asyncio.current_task():
+                del self.round_timers[room_id]
+        await self.submit(room_id, self._expire_round, room_id, drawer, word)
+
+    async def _expire_round(self, room_id, drawer, word):
+        # Re-checked on the actor: a guess queued before us may already have ended the round
         room = self.rooms.get(room_id)
-        if room:
-            gs = room.get("game_state")
-            if gs and gs["drawer"] == drawer and gs["word"] == word and gs["phase"] == "DRAWING":
-                await self.end_round(room_id)
+        gs = room.game_state if room else None
+        if gs and gs.drawer == drawer and gs.word == word and gs.phase == "DRAWING":
+            metrics.round_timers_expired.inc()
+            await self.end_round(room_id)
 
+    @traced
     async def end_round(self, room_id: str):
         room = self.rooms[room_id]
-        gs = room["game_state"]
+        gs = room.game_state
         # Allow ending from drawing or preparing if needed, but mostly drawing
-        if gs["phase"] not in ["DRAWING", "DRAWER_PREPARING"]: return
+        if gs.phase not in ["DRAWING", "DRAWER_PREPARING"]: return
         
-        gs["last_drawer"] = gs["drawer"]
-        gs["last_word"] = gs["word"]
-        gs["timer_end"] = 0 # STOP the countdown
+        gs.last_drawer = gs.drawer
+        gs.last_word = gs.word
+        gs.timer_end = 0 # STOP the countdown
 
         # Apply points officially
-        for nick, res in gs.get("turn_results", {}).items():
-            if nick in room["players"]:
-                room["players"][nick]["score"] += res["points"]
+        scored = [nick for nick, res in gs.turn_results.items() if nick in room.players and res["points"]]
+        for nick in scored:
+            room.players[nick].score += gs.turn_results[nick]["points"]
+        await self.broadcast_scores(room_id, scored)
 
         # Jump straight to next turn / preparing
         await self.next_turn(room_id)
 
+    @traced
     async def end_game(self, room_id: str):
         room = self.rooms[room_id]
-        room["game_state"]["phase"] = "GAME_OVER"
+        room.game_state.phase = "GAME_OVER"
         await self.broadcast_game_state(room_id)
+        self.stop_recording(room_id)
 
+    @traced
     async def broadcast_game_state(self, room_id: str):
+         if self.coalesced.get(room_id):
+             await self.flush_coalesced(room_id) # Sequenced after what was queued before it
          room = self.rooms[room_id]
-         gs = room["game_state"]
-         import time
-         
-         public_gs = {
-             "round": gs.get("round", 1),
-             "drawer": gs["drawer"],
-             "phase": gs["phase"],
-             "timer_end": gs["timer_end"],
-             "time_left": max(0, gs["timer_end"] - time.time()) if gs["timer_end"] > 0 else 0,
-             "word": gs["word"] if gs["phase"] in ["DRAWER_PREPARING", "GAME_OVER"] else None,
-             "word_hints": gs["current_word_obfuscated"],
-             "correct_guessers": gs.get("correct_guessers", []),
-             "last_drawer": gs.get("last_drawer"),
-             "last_word": gs.get("last_word"),
-             "first_guesser_nickname": gs.get("first_guesser_nickname")
+         gs = room.game_state
+         public_gs = gs.public(self.clock())
+         room.seq += 1
+         message = {
+             "type": "GAME_STATE_UPDATE",
+             "payload": {
+                 "game_state": public_gs,
+                 "turn_results": gs.turn_results
+             },
+             "seq": room.seq
          }
-         
-         for nickname, p in room["players"].items():
-              if p["connected"]:
-                  is_drawer = (nickname == gs["drawer"])
-                  view_gs = public_gs.copy()
-                  # Drawer sees word in PREPARING and DRAWING
-                  if is_drawer and gs["phase"] in ["DRAWING", "DRAWER_PREPARING"]:
-                      view_gs["word"] = gs["word"]
-                      
-                  await self.send_to_client(room_id, p["client_id"], {
-                      "type": "GAME_STATE_UPDATE",
-                      "payload": {
-                          "game_state": view_gs,
-                          "scores": {n: pl["score"] for n, pl in room["players"].items()},
-                          "turn_results": gs.get("turn_results", {})
-                      }
-                  })
+         text = json.dumps(message)
+
+         # Drawer sees word in PREPARING and DRAWING; everyone else shares one serialized view
+         private = None
+         if gs.drawer in room.players and gs.phase in ["DRAWING", "DRAWER_PREPARING"]:
+             message["payload"]["game_state"] = dict(public_gs, word=gs.word)
+             private = {gs.drawer: json.dumps(message)}
+         room.add_to_outbox((room.seq, text, None, private))
 
+         preparing = self.preparing.get(room_id, ())
+         for nickname, p in list(room.players.items()):
+              if p.connected and p.client_id not in preparing:
+                  view = private.get(nickname, text) if private else text
+                  await self.send_text_to_client(room_id, p.client_id, view, "GAME_STATE_UPDATE")
+
+         # Spectators get the public view in their next batch; recordings keep it too
+         if room_id in self.spectators:
+             self.spectator_buffers.setdefault(room_id, []).append(text)
+         recorder = self.recorders.get(room_id)
+         if recorder:
+             recorder.record(text)
+
+    @traced
     async def send_full_state_to_client(self, room_id: str, client_id: str, nickname: str):
         """Sends both GAME_STATE_UPDATE and STROKE_HISTORY_UPDATE to a single client."""
         room = self.rooms.get(room_id)
         if not room: return
-        gs = room.get("game_state")
+        gs = room.game_state
         if not gs: return
 
-        import time
-        public_gs = {
-            "round": gs.get("round", 1),
-            "drawer": gs["drawer"],
-            "phase": gs["phase"],
-            "timer_end": gs["timer_end"],
-            "time_left": max(0, gs["timer_end"] - time.time()) if gs["timer_end"] > 0 else 0,
-            "word": gs["word"] if gs["phase"] in ["DRAWER_PREPARING", "GAME_OVER"] else None,
-            "word_hints": gs["current_word_obfuscated"],
-            "correct_guessers": gs.get("correct_guessers", []),
-            "last_drawer": gs.get("last_drawer"),
-            "last_word": gs.get("last_word"),
-            "first_guesser_nickname": gs.get("first_guesser_nickname")
-        }
-
-        is_drawer = (nickname == gs["drawer"])
-        view_gs = public_gs.copy()
-        if is_drawer and gs["phase"] in ["DRAWING", "DRAWER_PREPARING"]:
-            view_gs["word"] = gs["word"]
-
-        # 1. Send State
-        await self.send_to_client(room_id, client_id, {
-            "type": "GAME_STATE_UPDATE",
-            "payload": {
-                "game_state": view_gs,
-                "scores": {n: pl["score"] for n, pl in room["players"].items()},
-                "turn_results": gs.get("turn_results", {})
-            }
-        })
-
-        # 2. Send History
-        if "stroke_history" in gs:
+        # 1. Send State. Drawer sees the word in PREPARING and DRAWING; everyone else gets the shared text.
+        if nickname == gs.drawer and gs.phase in ["DRAWING", "DRAWER_PREPARING"]:
             await self.send_to_client(room_id, client_id, {
-                "type": "STROKE_HISTORY_UPDATE",
-                "payload": {"history": gs["stroke_history"]}
+                "type": "GAME_STATE_UPDATE",
+                "payload": {
+                    "game_state": dict(gs.public(self.clock()), word=gs.word),
+                    "turn_results": gs.turn_results
+                }
             })
+        else:
+            await self.send_text_to_client(room_id, client_id, self.shared_state_text(room_id), "GAME_STATE_UPDATE")
+
+        # 2. Send History. A big one is encoded off the loop, and off the actor so the room carries on meanwhile.
+        if gs.history_bytes > OFFLOAD_MIN_BYTES:
+            self.start_history_transfer(room_id, client_id, nickname)
+        else:
+            await self.send_text_to_client(
+                room_id, client_id, history_text(self.encoded_history(room_id).result()), "STROKE_HISTORY_UPDATE"
+            )
+
+    def shared_state_text(self, room_id: str) -> str:
+        """GAME_STATE_UPDATE for anyone but the drawer, serialized again only once the room has moved on."""
+        room = self.rooms[room_id]
+        cached = self.state_cache.get(room_id)
+        if cached is None or cached[0] != room.seq:
+            gs = room.game_state
+            cached = self.state_cache[room_id] = (room.seq, json.dumps({
+                "type": "GAME_STATE_UPDATE",
+                "payload": {
+                    "game_state": gs.public(self.clock()),
+                    "turn_results": gs.turn_results
+                }
+            }))
+        return cached[1]
+
+    def encoded_history(self, room_id: str) -> asyncio.Future:
+        """
+        The room's stroke history as JSON, shared until it changes. Whatever changes
+        the history pops history_cache. A big one is encoded on the offload pool.
+        """
+        future = self.history_cache.get(room_id)
+        if future is None:
+            gs = self.rooms[room_id].game_state
+            if gs.history_bytes > OFFLOAD_MIN_BYTES:
+                future = asyncio.ensure_future(offload.encode_list(room_id, snapshot_history(gs.stroke_history)))
+            else:
+                future = asyncio.get_running_loop().create_future()
+                future.set_result(json.dumps(gs.stroke_history))
+            self.history_cache[room_id] = future
+        return future
+
+    def start_history_transfer(self, room_id: str, client_id: str, nickname: Optional[str]):
+        self.stop_history_transfer(room_id, client_id)
+        encoded = self.encoded_history(room_id)
+        task = asyncio.create_task(self._transfer_history(room_id, client_id, nickname, encoded, self.rooms[room_id].seq))
+        self.preparing.setdefault(room_id, {})[client_id] = task
+
+    def stop_history_transfer(self, room_id: str, client_id: str):
+        transfers = self.preparing.get(room_id, {})
+        task = transfers.pop(client_id, None)
+        if not transfers:
+            self.preparing.pop(room_id, None)
+        if task is not None:
+            task.cancel()
 
+    async def _transfer_history(self, room_id: str, client_id: str, nickname: Optional[str], encoded: asyncio.Future, seq: int):
+        try:
+            # Shielded: other joiners may be waiting on the same encoding
+            encoded = await asyncio.shield(encoded)
+            await self.send_text_to_client(room_id, client_id, history_text(encoded), "STROKE_HISTORY_UPDATE")
+            # Then what the room said since the snapshot, until the client is caught up
+            while room_id in self.rooms:
+                missed = self.messages_since(room_id, client_id, nickname, seq)
+                if missed is None:
+                    # Fell out of the outbox meanwhile: start over from a new snapshot
+                    await self.send_full_state_to_client(room_id, client_id, nickname)
+                    return
+                if not missed:
+                    break
+                seq = self.rooms[room_id].seq
+                await self.send_text_to_client(room_id, client_id, batch_text(missed), "BATCH")
+        except Exception:
+            logger.exception(f"History transfer to {client_id} in room {room_id} failed")
+        finally:
+            transfers = self.preparing.get(room_id, {})
+            if transfers.get(client_id) is asyncio.current_task():
+                del transfers[client_id]
+                if not transfers:
+                    del self.preparing[room_id]
+
+    @traced
     async def process_chat_message(self, room_id: str, nickname: str, text: str):
         room = self.rooms[room_id]
-        gs = room.get("game_state")
-        is_playing = room["state"] == "playing" and gs and gs["phase"] == "DRAWING"
+        gs = room.game_state
+        is_playing = room.state == "playing" and gs and gs.phase == "DRAWING"
         
         if is_playing:
-             if nickname == gs["drawer"]: return
-             if nickname in gs["correct_guessers"]: return
+             if nickname == gs.drawer: return
+             if nickname in gs.correct_guessers: return
              
-             if text.lower().strip() == gs["word"].lower().strip():
+             if text.lower().strip() == gs.word.lower().strip():
                  # Correct Guess
-                 import time
-                 t_left = max(0, gs["timer_end"] - time.time())
-                 base_points = room["config"].get("base_points", 10)
+                 t_left = max(0, gs.timer_end - self.clock())
+                 base_points = room.config.get("base_points", 10)
                  
-                 is_first = len(gs["correct_guessers"]) == 0
-                 duration = room["config"]["round_duration"]
+                 is_first = len(gs.correct_guessers) == 0
+                 duration = room.config["round_duration"]
                  time_taken = round(duration - t_left, 1)
 
                  if is_first:
-                     gs["first_guess_time_left"] = t_left
-                     gs["first_guesser_nickname"] = nickname
+                     gs.first_guess_time_left = t_left
+                     gs.first_guesser_nickname = nickname
                      points = base_points
                      # Drawer points (calculated only on first guess)
                      drawer_points = min(base_points, round(t_left / (duration * 0.75) * base_points))
-                     gs["turn_results"][gs["drawer"]] = {"points": drawer_points, "time": time_taken}
+                     gs.turn_results[gs.drawer] = {"points": drawer_points, "time": time_taken}
                  else:
-                     t_first = gs["first_guess_time_left"]
+                     t_first = gs.first_guess_time_left
                      if t_first > 0:
                          points = round((t_left / t_first) * base_points)
                      else:
                          points = 0 # Should not happen if guess is during active round
                  
-                 gs["turn_results"][nickname] = {"points": points, "time": time_taken}
-                 gs["correct_guessers"].append(nickname)
+                 gs.turn_results[nickname] = {"points": points, "time": time_taken}
+                 gs.correct_guessers.append(nickname)
                  
                  await self.broadcast(room_id, {
                      "type": "CHAT",
@@ -525,14 +1409,14 @@ class ConnectionManager:
                  
                  # Check if all players guessed
                  guessers_needed = 0
-                 host_plays = room["config"].get("host_plays", True)
-                 for p_nick, p_data in room["players"].items():
-                     if not p_data["connected"]: continue
-                     if p_nick == gs["drawer"]: continue
-                     if p_data["is_host"] and not host_plays: continue
+                 host_plays = room.config.get("host_plays", True)
+                 for p_nick, p_data in room.players.items():
+                     if not p_data.connected: continue
+                     if p_nick == gs.drawer: continue
+                     if p_data.is_host and not host_plays: continue
                      guessers_needed += 1
                  
-                 if len(gs["correct_guessers"]) >= guessers_needed:
+                 if len(gs.correct_guessers) >= guessers_needed:
                      await self.end_round(room_id)
                  else:
                      # Update game state to show who guessed? Or just scores.
@@ -540,7 +1424,7 @@ class ConnectionManager:
                  return
              else:
                  # Incorrect - Masked
-                 color = room["players"][nickname].get("color", "#FFFFFF")
+                 color = room.players[nickname].color
                  await self.broadcast(room_id, {
                      "type": "CHAT",
                      "payload": { "sender": nickname, "color": color, "text": "guessed incorrectly" }
@@ -548,56 +1432,113 @@ class ConnectionManager:
                  return
         
         # Normal chat (Lobby, Pre/Post round)
-        color = room["players"][nickname].get("color", "#FFFFFF")
+        color = room.players[nickname].color
         await self.broadcast(room_id, {
             "type": "CHAT",
             "payload": { "sender": nickname, "color": color, "text": text }
         })
 
     def remove_player_from_room(self, room_id: str, nickname: str):
-         if room_id in self.rooms and nickname in self.rooms[room_id]["players"]:
-             del self.rooms[room_id]["players"][nickname]
+         if room_id in self.rooms and nickname in self.rooms[room_id].players:
+             del self.rooms[room_id].players[nickname]
+             self.rooms[room_id].roster_changed()
 
     def is_drawer(self, room_id: str, nickname: str) -> bool:
-        if room_id not in self.rooms: return False
-        return self.rooms[room_id]["game_state"]["drawer"] == nickname
+        room = self.rooms.get(room_id)
+        return room is not None and room.game_state is not None and room.game_state.drawer == nickname
 
-    async def record_stroke(self, room_id: str, nickname: str, stroke: dict):
-        if not self.is_drawer(room_id, nickname): return
-        gs = self.rooms[room_id]["game_state"]
-        if gs["phase"] not in ["DRAWING", "DRAWER_PREPARING"]: return
-        gs["stroke_history"].append(stroke)
+    async def record_stroke(self, room_id: str, nickname: str, stroke: dict, size: int = None, path: bool = False) -> Optional[dict]:
+        """
+        Stores a DRAW_STROKE segment, or applies a DRAW_PATH message if path is set.
+        Returns its canonical form if it was stored and should be relayed, else None.
+        """
+        if not self.is_drawer(room_id, nickname): return None
+        gs = self.rooms[room_id].game_state
+        if gs.phase not in ["DRAWING", "DRAWER_PREPARING"]: return None
+        stroke = canonical_path_op(stroke) if path else canonical_segment(stroke)
+        if stroke is None:
+            return None
+        if size is None:
+            size = len(json.dumps(stroke))
+
+        if gs.history_bytes + size > ROOM_HISTORY_HARD_BYTES:
+            if not gs.history_full:
+                gs.history_full = True
+                client_id = self.rooms[room_id].players[nickname].client_id
+                await self.send_to_client(room_id, client_id, {
+                    "type": "ERROR",
+                    "payload": {"message": "The drawing is too large. Undo or clear the canvas to keep drawing."}
+                })
+            return None
+
+        if path:
+            added = apply_path_op(gs.stroke_history, stroke)
+            if added is None:
+                return None
+            gs.history_bytes += added
+        else:
+            gs.stroke_history.append(stroke)
+            gs.history_bytes += size
+        self.history_cache.pop(room_id, None)
+        if gs.history_bytes > ROOM_HISTORY_SOFT_BYTES and not gs.history_compacted:
+            await self.compact_stroke_history(room_id)
+        return stroke
+
+    async def compact_stroke_history(self, room_id: str):
+        gs = self.rooms[room_id].game_state
+        before = gs.history_bytes
+        # Runs on the actor, so nothing else touches the history until this returns
+        gs.history_compacted = True
+        if before > OFFLOAD_MIN_BYTES:
+            history = await offload.run(room_id, "compact", compact_history, gs.stroke_history)
+            size = len(await offload.encode_list(room_id, history))
+        else:
+            history = compact_history(gs.stroke_history)
+            size = len(json.dumps(history))
+        gs.stroke_history, gs.history_bytes = history, size
+        self.history_cache.pop(room_id, None)
+        logger.info(f"Compacted stroke history of room {room_id}: {before} -> {gs.history_bytes} bytes")
 
+    @traced
     async def undo_stroke(self, room_id: str, nickname: str):
         if not self.is_drawer(room_id, nickname): return
-        gs = self.rooms[room_id]["game_state"]
-        if gs["phase"] not in ["DRAWING", "DRAWER_PREPARING"]: return
-        if gs["stroke_history"]:
-            last_stroke = gs["stroke_history"][-1]
+        gs = self.rooms[room_id].game_state
+        if gs.phase not in ["DRAWING", "DRAWER_PREPARING"]: return
+        if gs.stroke_history:
+            last_stroke = gs.stroke_history[-1]
             action_id = last_stroke.get("actionId")
             
             if action_id:
                 # Remove all strokes with the same actionId
-                gs["stroke_history"] = [s for s in gs["stroke_history"] if s.get("actionId") != action_id]
+                removed = [s for s in gs.stroke_history if s.get("actionId") == action_id]
+                gs.stroke_history = [s for s in gs.stroke_history if s.get("actionId") != action_id]
             else:
                 # Fallback for old/legacy strokes
-                gs["stroke_history"].pop()
+                removed = [gs.stroke_history.pop()]
 
-            # Broadcast the full history update
-            await self.broadcast(room_id, {
-                "type": "STROKE_HISTORY_UPDATE",
-                "payload": {"history": gs["stroke_history"]}
-            })
+            # A polyline can be as big as thousands of segments, so size what was removed
+            gs.history_bytes = max(0, gs.history_bytes - len(json.dumps(removed)))
+            gs.history_full = False
+            self.history_cache.pop(room_id, None)
 
+            # Broadcast the full history update; whoever joins next reuses the encoding
+            encoded = await asyncio.shield(self.encoded_history(room_id))
+            await self.broadcast_encoded(room_id, "STROKE_HISTORY_UPDATE", f'{{"history": {encoded}}}')
+
+    @traced
     async def clear_canvas_history(self, room_id: str, nickname: str):
         if not self.is_drawer(room_id, nickname): return
-        gs = self.rooms[room_id]["game_state"]
-        gs["stroke_history"] = []
+        gs = self.rooms[room_id].game_state
+        gs.stroke_history = []
+        gs.history_bytes = 0
+        gs.history_full = False
+        self.history_cache.pop(room_id, None)
         await self.broadcast(room_id, {
             "type": "CLEAR_CANVAS",
             "payload": {}
         })
 
+    @traced
     async def close_room(self, room_id: str):
         if room_id in self.rooms:
             # Notify everyone
@@ -605,28 +1546,124 @@ class ConnectionManager:
                 "type": "ROOM_CLOSED",
                 "payload": {}
             })
+            # Spectators hear about it right away rather than in the next batch
+            for ws in list(self.spectators.get(room_id, {}).values()):
+                try:
+                    await ws.send_text(json.dumps({"type": "ROOM_CLOSED", "payload": {}}))
+                except Exception:
+                    pass
+            await self.close_spectators(room_id)
+            self.stop_recording(room_id)
+            self.heartbeats.pop(room_id, None)
+            self.stop_offloads(room_id)
+            self.drop_caches(room_id)
+            flight.drop(room_id)
+
             # Close all connections
             if room_id in self.active_connections:
                 for client_id, ws in list(self.active_connections[room_id].items()):
                     await ws.close()
                 del self.active_connections[room_id]
             
-            # Remove room data
+            # Remove room data; the actor stops once the current input is handled
             del self.rooms[room_id]
+            self.stop_actor(room_id)
 
     def cleanup_empty_rooms(self):
-        import time
-        now = time.time()
+        started = time.perf_counter()
+        now = self.clock()
         to_remove = []
         for room_id, room in self.rooms.items():
-            if room.get("empty_since") and (now - room["empty_since"] > 300): # 5 minutes
+            if room.empty_since and (now - room.empty_since > 300): # 5 minutes
                 to_remove.append(room_id)
         
         for room_id in to_remove:
-            # Just delete it, no one is there to notify
+            # Just delete it, no players are there to notify
             if room_id in self.active_connections:
                 del self.active_connections[room_id]
+            if room_id in self.spectators:
+                asyncio.create_task(self.close_spectators(room_id))
+            self.stop_recording(room_id)
+            self.heartbeats.pop(room_id, None)
+            self.stop_offloads(room_id)
+            self.drop_caches(room_id)
+            flight.drop(room_id)
             del self.rooms[room_id]
+            self.stop_actor(room_id)
+
+        metrics.cleanup_sweeps.inc()
+        metrics.cleanup_rooms_removed.inc(amount=len(to_remove))
+        metrics.cleanup_seconds.observe(time.perf_counter() - started)
+
+    # --- Memory accounting ---
+
+    def room_memory(self, room_id: str) -> dict:
+        """Approximate serialized size of a room's state, by part."""
+        room = self.rooms[room_id]
+        gs = room.game_state
+        usage = {
+            "history": gs.history_bytes if gs else 0,
+            # Asleep, a room has dropped its cached player views; don't bring them back
+            "players": len(room.roster_json()) if room.hibernated is None else len(json.dumps(room.player_list())),
+            "used_words": sum(len(w) + 4 for w in gs.used_words) if gs else 0,
+            "outbox": room.outbox_bytes,
+            "turn_results": len(json.dumps(gs.turn_results)) if gs else 0,
+            "config": len(json.dumps(room.config)),
+            "hibernated": len(room.hibernated) if room.hibernated is not None else 0,
+        }
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def memory_report(self) -> List[dict]:
+        report = [{
+            "id": room_id,
+            "name": room.name,
+            "state": room.state,
+            "hibernated": room.hibernated is not None,
+            "connections": len(self.active_connections.get(room_id, {})),
+            "strokes": len(room.game_state.stroke_history) if room.game_state else 0,
+            "memory": self.room_memory(room_id)
+        } for room_id, room in self.rooms.items()]
+        report.sort(key=lambda r: r["memory"]["total"], reverse=True)
+        return report
+
+    async def enforce_room_budget(self, room_id: str):
+        # Last resort: history is capped separately, so this only trips on abuse we didn't foresee
+        if room_id in self.rooms and self.room_memory(room_id)["total"] > ROOM_MAX_BYTES:
+            logger.warning(f"Room {room_id} exceeded {ROOM_MAX_BYTES} bytes, closing it")
+            await self.close_room(room_id)
+
+    async def enforce_budgets(self):
+        for room_id, room in list(self.rooms.items()):
+            # A sleeping room hasn't grown since it was last checked
+            if room.hibernated is None and self.room_memory(room_id)["total"] > ROOM_MAX_BYTES:
+                await self.submit(room_id, self.enforce_room_budget, room_id)
+
+    # --- Metrics (computed on scrape only) ---
+
+    def rooms_by_state(self) -> Dict[tuple, int]:
+        counts = {}
+        for room in self.rooms.values():
+            key = (room.state,)
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def open_connection_count(self) -> int:
+        return sum(len(conns) for conns in self.active_connections.values())
+
+    def inbox_depths(self) -> Dict[tuple, int]:
+        depths = [inbox.qsize() for inbox in self.inboxes.values()]
+        return {("total",): sum(depths), ("max",): max(depths, default=0)}
+
+    def stroke_history_stats(self) -> Dict[tuple, int]:
+        sizes = [len(r.game_state.stroke_history) for r in self.rooms.values() if r.game_state]
+        return {("total",): sum(sizes), ("max",): max(sizes, default=0)}
 
 # Global instance
 manager = ConnectionManager()
+
+metrics.Gauge("patty_rooms", "Rooms by state", ("state",), func=manager.rooms_by_state)
+metrics.Gauge("patty_websockets_open", "Open WebSocket connections", func=manager.open_connection_count)
+metrics.Gauge("patty_stroke_history_strokes", "Stroke history entries across rooms", ("stat",), func=manager.stroke_history_stats)
+metrics.Gauge("patty_rooms_hibernated", "Rooms whose game state is compressed until their next input", func=manager.hibernated_count)
+metrics.Gauge("patty_room_inbox_depth", "Inputs waiting in room actor inboxes", ("stat",), func=manager.inbox_depths)
@@ -0,0 +1,158 @@
+import bisect
+import os
+import resource
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Minimal Prometheus text-format instruments. Updating one is a dict or list
+# increment, so they are cheap enough for the DRAW_STROKE path; anything that
+# can be derived from manager state is a Gauge computed only when scraped.
+
+REGISTRY: List["Metric"] = []
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def lines(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def lines(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in self.values.items()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (), func: Optional[Callable] = None):
+        super().__init__(name, description, labels)
+        self.values: Dict[tuple, float] = {}
+        # func() -> value, or {label tuple: value} when the gauge has labels
+        self.func = func
+
+    def set(self, value: float, *label_values):
+        self.values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) - amount
+
+    def lines(self) -> List[str]:
+        values = self.values
+        if self.func is not None:
+            values = self.func()
+            if not self.labels:
+                values = {(): values}
+        return [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...], labels: Tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+        # label tuple -> [per-bucket counts (+Inf last), sum]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        entry = self.values.get(label_values)
+        if entry is None:
+            entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def lines(self) -> List[str]:
+        out = []
+        for k, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labels, k, 'le="' + le + '"')
+                out.append(f"{self.name}_bucket{labels} {cumulative}")
+            out.append(f"{self.name}_sum{_format_labels(self.labels, k)} {total}")
+            out.append(f"{self.name}_count{_format_labels(self.labels, k)} {cumulative}")
+        return out
+
+
+def render() -> str:
+    out = []
+    for metric in REGISTRY:
+        out.append(f"# HELP {metric.name} {metric.description}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.lines())
+    return "\n".join(out) + "\n"
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+messages_received = Counter("patty_ws_messages_received_total", "Inbound WebSocket messages", ("type",))
+bytes_received = Counter("patty_ws_bytes_received_total", "Inbound WebSocket payload size (text characters)", ("type",))
+messages_sent = Counter("patty_ws_messages_sent_total", "Outbound WebSocket messages (per recipient)", ("type",))
+bytes_sent = Counter("patty_ws_bytes_sent_total", "Outbound WebSocket payload size (text characters, per recipient)", ("type",))
+broadcast_seconds = Histogram("patty_broadcast_seconds", "Time to fan a message out to a room", LATENCY_BUCKETS)
+round_timers_started = Counter("patty_round_timers_started_total", "Round timers started")
+round_timers_expired = Counter("patty_round_timers_expired_total", "Round timers that ended their round")
+round_timers_active = Gauge("patty_round_timers_active", "Round timers currently sleeping")
+rooms_hibernated = Counter("patty_rooms_hibernated_total", "Idle rooms compressed until their next input")
+rooms_woken = Counter("patty_rooms_woken_total", "Hibernated rooms brought back by an input")
+rooms_restored = Counter("patty_rooms_restored_total", "Rooms taken over from a drained process (handoff.py)")
+drain_seconds = Gauge("patty_drain_seconds", "How long the last drain took")
+flight_dumps = Counter("patty_flight_dumps_total", "Flight recorder dumps written to FLIGHT_DIR", ("reason",))
+cleanup_sweeps = Counter("patty_cleanup_sweeps_total", "Empty room cleanup sweeps")
+cleanup_rooms_removed = Counter("patty_cleanup_rooms_removed_total", "Rooms removed by cleanup sweeps")
+cleanup_seconds = Histogram("patty_cleanup_sweep_seconds", "Duration of cleanup sweeps", LATENCY_BUCKETS)
+loop_lag_seconds = Histogram("patty_event_loop_lag_seconds", "Event loop scheduling delay", LATENCY_BUCKETS)
+loop_lag_last = Gauge("patty_event_loop_lag_last_seconds", "Most recent event loop lag sample")
+client_rtt_seconds = Histogram("patty_client_rtt_seconds", "Heartbeat round trip time", LATENCY_BUCKETS)
+heartbeat_reaped = Counter("patty_heartbeat_reaped_total", "Sockets closed for missing heartbeats")
+room_batch_size = Histogram("patty_room_batch_size", "Inputs a room actor handled in one go", (1, 2, 4, 8, 16, 32, 64))
+admission_rejected = Counter("patty_admission_rejected_total", "Rooms, joins and connections turned away", ("reason",))
+offload_jobs = Counter("patty_offload_jobs_total", "Jobs completed in the offload pool", ("job",))
+offload_cancelled = Counter("patty_offload_cancelled_total", "Offload jobs abandoned, mostly because their room closed", ("job",))
+offload_seconds = Histogram("patty_offload_seconds", "Time from submitting an offload job to its result, queueing included", LATENCY_BUCKETS)
+slow_handlers = Counter("patty_slow_handlers_total", "Handlers that ran past SLOW_HANDLER_SECONDS", ("handler",))
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _resident_memory_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Not Linux: peak RSS is the best we have (KiB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+Gauge("process_cpu_seconds_total", "User and system CPU time of this worker", func=_cpu_seconds)
+Gauge("process_resident_memory_bytes", "Resident memory of this worker", func=_resident_memory_bytes)
@@ -1,5 +1,8 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional, Set, Tuple
+from collections import deque
+from dataclasses import dataclass, field, fields
+import json
 
 from enum import Enum
 
@@ -7,10 +10,14 @@ class GameType(str, Enum):
     DRAWING = "drawing"
 
 class GameConfig(BaseModel):
-    round_duration: int = 60
-    points_to_win: int = 5
-    turn_order: str = "sequence" # "sequence" or "winner"
+    # Bounds follow the lobby's controls in static/index.html
+    round_duration: int = Field(60, ge=30, le=180)
+    points_to_win: int = Field(50, ge=5, le=250)
+    base_points: int = Field(10, ge=1, le=250) # At most points_to_win, see manager.merge_config
+    turn_order: Literal["sequence", "winner"] = "sequence"
     host_plays: bool = True
+    word_language: Optional[str] = Field(None, max_length=64) # None: the first of WORD_SETS
+    word_difficulty: Optional[str] = Field(None, max_length=64)
 
 class CreateRoomRequest(BaseModel):
     name: str
@@ -23,7 +30,122 @@ class JoinRoomRequest(BaseModel):
     password: Optional[str] = None
     nickname: str
 
-class Player(BaseModel):
+def to_fields(obj) -> dict:
+    """A dataclass's fields by name (not recursive), for state that outlives this code version (handoff.py)."""
+    return {f.name: getattr(obj, f.name) for f in fields(obj)}
+
+def from_fields(cls, values: dict):
+    """cls from to_fields() output, maybe an older version's: unknown fields are dropped, missing ones get defaults."""
+    names = {f.name for f in fields(cls)}
+    return cls(**{k: v for k, v in values.items() if k in names})
+
+# Live room state. Slotted: no per-instance __dict__, and a typo'd field is an
+# AttributeError instead of a silently new key. The view methods build the wire format.
+
+@dataclass(slots=True)
+class Player:
     nickname: str
     client_id: str
     is_host: bool = False
+    connected: bool = True
+    is_ready: bool = False
+    score: int = 0
+    color: str = "#FFFFFF"
+    view_json: Optional[str] = None # view() encoded; cleared by Room.roster_changed
+
+    def view(self) -> dict:
+        return {
+            "nickname": self.nickname,
+            "is_host": self.is_host,
+            "is_ready": self.is_ready,
+            "color": self.color,
+            "connected": self.connected,
+            "score": self.score
+        }
+
+@dataclass(slots=True)
+class GameState:
+    round: int = 0
+    drawer: Optional[str] = None
+    word: Optional[str] = None
+    turn_queue: List[str] = field(default_factory=list)
+    timer_end: float = 0
+    phase: str = "PRE_ROUND"
+    current_word_obfuscated: str = ""
+    correct_guessers: List[str] = field(default_factory=list)
+    first_guess_time_left: float = 0
+    first_guesser_nickname: Optional[str] = None
+    last_drawer: Optional[str] = None
+    last_word: Optional[str] = None
+    turn_results: Dict[str, dict] = field(default_factory=dict) # nickname -> {points, time}
+    stroke_history: List[dict] = field(default_factory=list)
+    history_bytes: int = 0 # Approximate serialized size of stroke_history
+    history_compacted: bool = False # Compaction runs at most once per drawing
+    history_full: bool = False # Drawer was told the history hit ROOM_HISTORY_HARD_BYTES
+    used_words: Set[str] = field(default_factory=set)
+    last_word_set: Optional[Tuple[str, str]] = None # (language, difficulty)
+
+    def public(self, now: float) -> dict:
+        """What everyone but the drawer may see, as of `now` (time.time() or the manager's clock)."""
+        return {
+            "round": self.round,
+            "drawer": self.drawer,
+            "phase": self.phase,
+            "timer_end": self.timer_end,
+            "time_left": max(0, self.timer_end - now) if self.timer_end > 0 else 0,
+            "word": self.word if self.phase in ("DRAWER_PREPARING", "GAME_OVER") else None,
+            "word_hints": self.current_word_obfuscated,
+            "correct_guessers": self.correct_guessers,
+            "last_drawer": self.last_drawer,
+            "last_word": self.last_word,
+            "first_guesser_nickname": self.first_guesser_nickname
+        }
+
+@dataclass(slots=True)
+class Room:
+    id: str
+    name: str
+    password: Optional[str] # sha256 hex, or None for an open room
+    room_token: str
+    game_type: str
+    config: dict
+    outbox: deque # (seq, text, exclude_client, {nickname: text} or None)
+    players: Dict[str, Player] = field(default_factory=dict) # nickname -> Player
+    state: str = "lobby"
+    empty_since: Optional[float] = None
+    seq: int = 0 # Last sequence number stamped on a room broadcast
+    roster_version: int = 0 # Bumped by every change to a Player.view(); stamped on roster messages
+    config_version: int = 0 # Bumped by every CONFIG_UPDATE
+    game_state: Optional[GameState] = None # Set by start_game
+    active_at: float = 0.0 # When the room's last input was submitted (manager clock)
+    hibernated: Optional[bytes] = None # game_state and outbox, compressed, while the room sleeps
+    outbox_bytes: int = 0 # Total length of the texts in outbox, for memory accounting
+
+    def player_list(self) -> List[dict]:
+        return [p.view() for p in self.players.values()]
+
+    def add_to_outbox(self, entry: tuple):
+        """Append (seq, text, ...) to the outbox, counting the entry the deque drops when full."""
+        if len(self.outbox) == self.outbox.maxlen:
+            self.outbox_bytes -= len(self.outbox[0][1])
+        self.outbox.append(entry)
+        self.outbox_bytes += len(entry[1])
+
+    def replace_outbox(self, outbox: deque):
+        self.outbox = outbox
+        self.outbox_bytes = sum(len(entry[1]) for entry in outbox)
+
+    def roster_json(self) -> str:
+        """player_list() as JSON. Each player is encoded again only after it changed."""
+        parts = []
+        for p in self.players.values():
+            if p.view_json is None:
+                p.view_json = json.dumps(p.view())
+            parts.append(p.view_json)
+        return "[" + ", ".join(parts) + "]"
+
+    def roster_changed(self, *players: Player):
+        """Call after changing what these players' view() shows, or adding or removing one."""
+        self.roster_version += 1
+        for p in players:
+            p.view_json = None
@@ -0,0 +1,50 @@
+import asyncio
+import functools
+import logging
+import time
+
+import flight
+import metrics
+from settings import FLIGHT_DUMP_SECONDS, LOOP_LAG_INTERVAL, SLOW_HANDLER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Smoothed loop lag (seconds), so a single hiccup doesn't trigger load shedding
+lag_average = 0.0
+
+
+async def loop_lag_monitor():
+    # Anything that blocks the loop shows up as oversleeping here
+    global lag_average
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL)
+        metrics.loop_lag_seconds.observe(lag)
+        metrics.loop_lag_last.set(lag)
+        lag_average = 0.7 * lag_average + 0.3 * lag
+        if lag > SLOW_HANDLER_SECONDS:
+            logger.warning(f"Event loop lagged {lag * 1000:.1f}ms")
+        if lag > FLIGHT_DUMP_SECONDS:
+            flight.lag_spike(lag, lag + LOOP_LAG_INTERVAL)
+
+
+def check_slow(handler: str, duration: float, room_id: str = None, msg_type: str = None, size: int = None):
+    if duration > SLOW_HANDLER_SECONDS:
+        metrics.slow_handlers.inc(handler)
+        logger.warning(
+            f"Slow handler {handler}: {duration * 1000:.1f}ms "
+            f"(room={room_id} type={msg_type} size={size})"
+        )
+
+
+def traced(func):
+    """Log a ConnectionManager coroutine that runs past the threshold. Expects room_id as first argument."""
+    @functools.wraps(func)
+    async def wrapper(self, room_id, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(self, room_id, *args, **kwargs)
+        finally:
+            check_slow(func.__name__, time.perf_counter() - started, room_id)
+    return wrapper
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+import metrics
+from settings import OFFLOAD_THREADS, OFFLOAD_MAX_PENDING
+
+# CPU-heavy work on big payloads (encoding and compacting large stroke histories)
+# runs on a small thread pool instead of the event loop. A thread only helps if it
+# lets go of the GIL now and then: pure Python code does, but one json.dumps call
+# holds it to the end, so lists are encoded ENCODE_CHUNK items per call.
+# Jobs belong to a room; cancel(room_id) abandons them when the room closes.
+
+ENCODE_CHUNK = 500
+
+executor = ThreadPoolExecutor(max_workers=OFFLOAD_THREADS, thread_name_prefix="offload")
+# Queued or running jobs; callers past OFFLOAD_MAX_PENDING wait their turn
+_slots = asyncio.Semaphore(OFFLOAD_MAX_PENDING)
+
+
+class Job:
+    __slots__ = ("cancelled", "future")
+
+    def __init__(self):
+        self.cancelled = threading.Event()  # Checked by the worker as well as here
+        self.future: Optional[asyncio.Future] = None
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+# room_id -> jobs waiting for a slot or running
+_jobs: Dict[str, Set[Job]] = {}
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _encode_list(items: List, cancelled: threading.Event) -> str:
+    # Same text as json.dumps(items)
+    parts = []
+    for i in range(0, len(items), ENCODE_CHUNK):
+        if cancelled.is_set():
+            raise Cancelled()
+        parts.append(json.dumps(items[i:i + ENCODE_CHUNK])[1:-1])
+    return "[" + ", ".join(parts) + "]"
+
+
+async def _submit(room_id: str, kind: str, fn, *args, job: Job = None):
+    job = job or Job()
+    jobs = _jobs.setdefault(room_id, set())
+    jobs.add(job)
+    started = time.perf_counter()
+    try:
+        async with _slots:
+            if job.cancelled.is_set():
+                raise asyncio.CancelledError()
+            job.future = asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            result = await job.future
+    except asyncio.CancelledError:
+        # A job that already started runs on in its thread, but the result is dropped
+        job.cancelled.set()
+        metrics.offload_cancelled.inc(kind)
+        raise
+    finally:
+        jobs.discard(job)
+        if not jobs and _jobs.get(room_id) is jobs:
+            del _jobs[room_id]
+    metrics.offload_jobs.inc(kind)
+    metrics.offload_seconds.observe(time.perf_counter() - started)
+    return result
+
+
+async def encode_list(room_id: str, items: List) -> str:
+    """json.dumps(items), computed off the loop and stopped early if cancelled."""
+    job = Job()
+    return await _submit(room_id, "encode", _encode_list, items, job.cancelled, job=job)
+
+
+async def run(room_id: str, kind: str, fn, *args):
+    """fn(*args) on the pool. Nothing else may change its arguments until it returns."""
+    return await _submit(room_id, kind, fn, *args)
+
+
+def cancel(room_id: str):
+    for job in list(_jobs.pop(room_id, ())):
+        job.cancel()
+
+
+def in_flight() -> int:
+    return sum(len(jobs) for jobs in _jobs.values())
+
+
+metrics.Gauge("patty_offload_jobs_in_flight", "Jobs waiting for or running in the offload pool", func=in_flight)
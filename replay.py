@@ -0,0 +1,116 @@
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from settings import REPLAY_DIR
+
+# Game recordings. Each game gets two append-only files in REPLAY_DIR:
+#   <game_id>.log  one event per line: "<ms since game start> <message JSON>"
+#   <game_id>.idx  one line per round: "<round> <byte offset into .log>"
+# Recording only appends already-serialized text to a list; a single
+# background loop writes the lists out in a thread.
+
+GAME_ID = re.compile(r"^[A-Za-z0-9-]+-\d+$")
+CHUNK_SIZE = 64 * 1024
+
+
+def enabled() -> bool:
+    return bool(REPLAY_DIR)
+
+
+class GameRecorder:
+    def __init__(self, room_id: str, clock=time.time):
+        self.clock = clock
+        self.started = clock()
+        self.game_id = f"{room_id}-{int(self.started * 1000)}"
+        self.path = os.path.join(REPLAY_DIR, self.game_id)
+        self.pending: List = []  # str lines, or int round markers
+        self.closed = False
+        self._log = None
+        self._idx = None
+
+    def record(self, text: str):
+        self.pending.append(f"{int((self.clock() - self.started) * 1000)} {text}\n")
+
+    def mark_round(self, round_number: int):
+        self.pending.append(round_number)
+
+    def _write(self, chunk: List):
+        # Runs in a worker thread; only the flush loop ever touches the files
+        if self._log is None:
+            self._log = open(self.path + ".log", "ab")
+            self._idx = open(self.path + ".idx", "ab")
+        for item in chunk:
+            if isinstance(item, int):
+                self._idx.write(f"{item} {self._log.tell()}\n".encode())
+            else:
+                self._log.write(item.encode())
+        self._log.flush()
+        self._idx.flush()
+        if self.closed:
+            self._log.close()
+            self._idx.close()
+
+    async def flush(self):
+        chunk, self.pending = self.pending, []
+        if chunk or self.closed:
+            await asyncio.to_thread(self._write, chunk)
+
+
+def _index(game_id: str) -> Dict[int, int]:
+    rounds = {}
+    with open(os.path.join(REPLAY_DIR, game_id + ".idx")) as f:
+        for line in f:
+            round_number, offset = line.split()
+            rounds[int(round_number)] = int(offset)
+    return rounds
+
+
+def list_games(room_id: Optional[str] = None) -> List[dict]:
+    games = []
+    for name in sorted(os.listdir(REPLAY_DIR)):
+        if not name.endswith(".log"):
+            continue
+        game_id = name[:-4]
+        if room_id and not game_id.startswith(room_id + "-"):
+            continue
+        games.append({
+            "game_id": game_id,
+            "started": int(game_id.rsplit("-", 1)[1]) / 1000,
+            "bytes": os.path.getsize(os.path.join(REPLAY_DIR, name)),
+            "rounds": sorted(_index(game_id)),
+        })
+    return games
+
+
+def byte_range(game_id: str, round_number: Optional[int] = None):
+    """(start, end) offsets of the whole game or one round; end None means to EOF. None if unknown."""
+    if not GAME_ID.match(game_id) or not os.path.exists(os.path.join(REPLAY_DIR, game_id + ".log")):
+        return None
+    if round_number is None:
+        return 0, None
+    rounds = _index(game_id)
+    if round_number not in rounds:
+        return None
+    later = [offset for r, offset in rounds.items() if r > round_number]
+    return rounds[round_number], min(later) if later else None
+
+
+async def stream(game_id: str, start: int, end: Optional[int]):
+    """Yield the .log file between two offsets in chunks, reading lazily off the loop."""
+    f = await asyncio.to_thread(open, os.path.join(REPLAY_DIR, game_id + ".log"), "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            chunk = await asyncio.to_thread(f.read, size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+import uvicorn
+
+import sharding
+from settings import HOST, PORT, WORKERS, RUN_DIR, FORWARDED_ALLOW_IPS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Behind a reverse proxy every socket's peer is the proxy: take the client from X-Forwarded-For
+UVICORN_OPTIONS = {
+    "loop": "uvloop", "ws": "websockets", "timeout_keep_alive": 60,
+    "proxy_headers": True, "forwarded_allow_ips": FORWARDED_ALLOW_IPS,
+}
+
+
+def run_worker(index: int, sock: socket.socket):
+    # WORKER_INDEX is already in our environment (see spawn_worker)
+    path = sharding.worker_socket(index)
+    if os.path.exists(path):
+        os.unlink(path)
+    uds = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    uds.bind(path)
+    uds.listen(2048)
+    server = uvicorn.Server(uvicorn.Config("main:app", **UVICORN_OPTIONS))
+    server.run(sockets=[sock, uds])
+
+
+def spawn_worker(ctx, index: int, sock: socket.socket):
+    os.environ["WORKER_INDEX"] = str(index)
+    p = ctx.Process(target=run_worker, args=(index, sock), name=f"worker-{index}")
+    p.start()
+    return p
+
+
+def main():
+    if WORKERS <= 1:
+        # Classic single process mode, all rooms in one ConnectionManager
+        uvicorn.run("main:app", host=HOST, port=PORT, **UVICORN_OPTIONS)
+        return
+
+    os.makedirs(RUN_DIR, exist_ok=True)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    threading.Thread(target=asyncio.run, args=(sharding.run_hub(),), daemon=True).start()
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [spawn_worker(ctx, i, sock) for i in range(WORKERS)]
+    logger.info(f"Started {WORKERS} workers on {HOST}:{PORT}")
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for p in procs:
+            p.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Rooms are pinned to an index, so a dead worker is restarted in place
+    while not stopping:
+        for i, p in enumerate(procs):
+            if not p.is_alive() and not stopping:
+                logger.warning(f"Worker {i} exited with {p.exitcode}, restarting")
+                procs[i] = spawn_worker(ctx, i, sock)
+        time.sleep(1)
+
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+
+# Process layout (see serve.py / sharding.py)
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 8000))
+WORKERS = int(os.environ.get("WORKERS", 1))
+WORKER_INDEX = int(os.environ.get("WORKER_INDEX", 0))
+RUN_DIR = os.environ.get("RUN_DIR", "/tmp/patty")
+# Reverse proxies whose X-Forwarded-For is believed for the client address (per-IP caps, logs):
+# comma separated addresses or networks (e.g. "10.0.0.0/8"). "*" trusts any peer and takes the
+# first address listed, which a client can forge; use it only if nothing reaches us around the proxy.
+FORWARDED_ALLOW_IPS = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1,::1")
+
+# How often each worker republishes its lobby list on the backplane (seconds)
+LOBBY_SYNC_INTERVAL = float(os.environ.get("LOBBY_SYNC_INTERVAL", 1.0))
+
+# Event loop lag sampling period and the duration above which handlers are logged as slow (seconds)
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", 0.5))
+SLOW_HANDLER_SECONDS = float(os.environ.get("SLOW_HANDLER_SECONDS", 0.1))
+
+# Application-level PING interval, and how long a socket may stay silent before it is reaped (seconds)
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", 15))
+HEARTBEAT_TIMEOUT = float(os.environ.get("HEARTBEAT_TIMEOUT", 45))
+
+# Admin endpoints (/admin/...) are disabled unless a token is set; send it as X-Admin-Token
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# Longest sampling profile /admin/profile will take (seconds)
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", 60))
+
+# Per-room resource budgets. Sizes are approximate serialized bytes.
+MAX_NICKNAME_LENGTH = int(os.environ.get("MAX_NICKNAME_LENGTH", 20))
+MAX_ROOM_NAME_LENGTH = int(os.environ.get("MAX_ROOM_NAME_LENGTH", 40))
+MAX_CHAT_LENGTH = int(os.environ.get("MAX_CHAT_LENGTH", 200))
+CHAT_MESSAGES_PER_SECOND = int(os.environ.get("CHAT_MESSAGES_PER_SECOND", 5))
+MAX_STROKE_MESSAGE_BYTES = int(os.environ.get("MAX_STROKE_MESSAGE_BYTES", 1024))
+ROOM_HISTORY_SOFT_BYTES = int(os.environ.get("ROOM_HISTORY_SOFT_BYTES", 2 * 1024 * 1024))  # Compact history
+ROOM_HISTORY_HARD_BYTES = int(os.environ.get("ROOM_HISTORY_HARD_BYTES", 4 * 1024 * 1024))  # Reject new strokes
+ROOM_MAX_BYTES = int(os.environ.get("ROOM_MAX_BYTES", 8 * 1024 * 1024))  # Close the room
+
+# Admission control, per worker; 0 disables a cap. While the smoothed event loop lag is above
+# SHED_LAG_SECONDS, new rooms and new players are turned away (games in progress carry on) and
+# told to retry after roughly SHED_RETRY_AFTER seconds.
+MAX_ROOMS = int(os.environ.get("MAX_ROOMS", 2000))
+# Players only: spectators never count. Big enough for the 100+ player lobbies the roster deltas are for.
+MAX_PLAYERS_PER_ROOM = int(os.environ.get("MAX_PLAYERS_PER_ROOM", 200))
+MAX_CONNECTIONS = int(os.environ.get("MAX_CONNECTIONS", 10000))
+MAX_CONNECTIONS_PER_IP = int(os.environ.get("MAX_CONNECTIONS_PER_IP", 100))
+SHED_LAG_SECONDS = float(os.environ.get("SHED_LAG_SECONDS", 0.25))
+SHED_RETRY_AFTER = int(os.environ.get("SHED_RETRY_AFTER", 5))
+
+# Reconnect storms. Joins to a room within JOIN_COALESCE_WINDOW seconds of the one before are
+# announced together. Clients are told to wait a random delay before reconnecting, spread over
+# the time it takes to take everyone back at RECONNECT_RATE joins per second (at most RECONNECT_MAX_DELAY).
+JOIN_COALESCE_WINDOW = float(os.environ.get("JOIN_COALESCE_WINDOW", 0.1))
+RECONNECT_RATE = int(os.environ.get("RECONNECT_RATE", 200))
+RECONNECT_MAX_DELAY = float(os.environ.get("RECONNECT_MAX_DELAY", 10))
+
+# Config changes a host makes within CONFIG_COALESCE_WINDOW seconds of the first pending one
+# are validated and broadcast together, so dragging a lobby slider costs one CONFIG_UPDATE.
+CONFIG_COALESCE_WINDOW = float(os.environ.get("CONFIG_COALESCE_WINDOW", 0.25))
+
+# Each room's inputs queue up for its actor; a full inbox makes the sending sockets wait.
+# The actor takes up to ROOM_BATCH_SIZE queued inputs at once and coalesces their strokes and chat.
+ROOM_INBOX_SIZE = int(os.environ.get("ROOM_INBOX_SIZE", 256))
+ROOM_BATCH_SIZE = int(os.environ.get("ROOM_BATCH_SIZE", 32))
+
+# Encoding or compacting a stroke history bigger than OFFLOAD_MIN_BYTES runs on a pool of
+# OFFLOAD_THREADS threads (see offload.py); at most OFFLOAD_MAX_PENDING jobs wait or run at once.
+OFFLOAD_MIN_BYTES = int(os.environ.get("OFFLOAD_MIN_BYTES", 256 * 1024))
+OFFLOAD_THREADS = int(os.environ.get("OFFLOAD_THREADS", 2))
+OFFLOAD_MAX_PENDING = int(os.environ.get("OFFLOAD_MAX_PENDING", 16))
+
+# Rooms without a game running (in the lobby or after GAME_OVER) that get no input for HIBERNATE_AFTER
+# seconds have their game state and resume buffer compressed in memory until the next one; 0 disables
+HIBERNATE_AFTER = float(os.environ.get("HIBERNATE_AFTER", 120))
+
+# Room broadcasts kept per room so a reconnecting client can resume from its last sequence number
+RESUME_BUFFER_SIZE = int(os.environ.get("RESUME_BUFFER_SIZE", 1024))
+
+# Spectators get room messages batched at this cadence (seconds)
+SPECTATOR_FLUSH_INTERVAL = float(os.environ.get("SPECTATOR_FLUSH_INTERVAL", 0.2))
+
+# Flight recorder (see flight.py): the last FLIGHT_RECORDER_SIZE events of each room, for
+# /admin/rooms/{room_id}/flight. With FLIGHT_DIR set, a handler or send slower than FLIGHT_DUMP_SECONDS,
+# or event loop lag above it, also writes the rooms involved there, at most once per FLIGHT_DUMP_COOLDOWN seconds.
+FLIGHT_RECORDER_SIZE = int(os.environ.get("FLIGHT_RECORDER_SIZE", 128))
+FLIGHT_DIR = os.environ.get("FLIGHT_DIR")
+FLIGHT_DUMP_SECONDS = float(os.environ.get("FLIGHT_DUMP_SECONDS", 0.25))
+FLIGHT_DUMP_COOLDOWN = float(os.environ.get("FLIGHT_DUMP_COOLDOWN", 60))
+
+# Zero-downtime deploys (see handoff.py): a draining worker writes its rooms to HANDOFF_DIR and the
+# next process with the same WORKER_INDEX picks them up. Draining waits up to DRAIN_TIMEOUT seconds for queued input.
+HANDOFF_DIR = os.environ.get("HANDOFF_DIR")
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", 5))
+
+# Game recordings (see replay.py) are off unless a directory is given; buffered events are written out at this cadence (seconds)
+REPLAY_DIR = os.environ.get("REPLAY_DIR")
+REPLAY_FLUSH_INTERVAL = float(os.environ.get("REPLAY_FLUSH_INTERVAL", 1.0))
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import os
+import zlib
+from typing import Callable, Dict, List
+
+from settings import WORKERS, WORKER_INDEX, RUN_DIR, LOBBY_SYNC_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Sharded mode (WORKERS > 1): serve.py starts one process per worker. Every room
+# lives on exactly one of them (owner_of), sockets that land on another worker
+# are proxied to the owner over its unix socket, and lobby data travels over a
+# small newline-delimited JSON pub/sub hub that serve.py runs in the parent.
+
+HUB_SOCKET = os.path.join(RUN_DIR, "backplane.sock")
+
+
+def worker_socket(index: int) -> str:
+    return os.path.join(RUN_DIR, f"worker-{index}.sock")
+
+
+def from_worker(websocket) -> bool:
+    """Came over a worker's unix socket, i.e. proxied by another worker."""
+    # Not websocket.client: with FORWARDED_ALLOW_IPS="*" uvicorn fills it from our own X-Forwarded-For
+    server = websocket.scope.get("server")
+    return server is not None and server[1] is None
+
+
+def is_sharded() -> bool:
+    return WORKERS > 1
+
+
+def owner_of(room_id: str) -> int:
+    # crc32 instead of hash(): str hashing is salted per process
+    return zlib.crc32(room_id.encode()) % WORKERS
+
+
+def is_local(room_id: str) -> bool:
+    return owner_of(room_id) == WORKER_INDEX
+
+
+class Backplane:
+    """Worker-side client of the hub. Handlers are called as handler(sender, data)."""
+
+    def __init__(self):
+        self.writer = None
+        self.generation = 0  # Bumped on every (re)connect
+        self.handlers: Dict[str, Callable[[int, object], None]] = {}
+        # worker index -> that worker's public room list
+        self.remote_rooms: Dict[int, List[dict]] = {}
+        self.subscribe("rooms", self._on_rooms)
+        self.subscribe("worker_down", lambda sender, data: self.remote_rooms.pop(sender, None))
+
+    def subscribe(self, topic: str, handler: Callable[[int, object], None]):
+        self.handlers[topic] = handler
+
+    def publish(self, topic: str, data):
+        if self.writer is None:
+            return
+        line = json.dumps({"from": WORKER_INDEX, "topic": topic, "data": data}) + "\n"
+        self.writer.write(line.encode())
+
+    def all_remote_rooms(self) -> List[dict]:
+        return [r for rooms in self.remote_rooms.values() for r in rooms]
+
+    def _on_rooms(self, sender: int, rooms: List[dict]):
+        self.remote_rooms[sender] = rooms
+
+    async def run(self):
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(HUB_SOCKET)
+                self.generation += 1
+                async for line in reader:
+                    msg = json.loads(line)
+                    handler = self.handlers.get(msg["topic"])
+                    if handler and msg["from"] != WORKER_INDEX:
+                        handler(msg["from"], msg["data"])
+            except OSError as e:
+                logger.warning(f"Backplane connection failed: {e}")
+            self.writer = None
+            await asyncio.sleep(1)
+
+
+backplane = Backplane()
+
+
+async def sync_lobby(get_rooms: Callable[[], List[dict]]):
+    # Room names are only unique per worker for up to one interval
+    last, last_generation = None, None
+    while True:
+        rooms = get_rooms()
+        if rooms != last or backplane.generation != last_generation:
+            backplane.publish("rooms", rooms)
+            last, last_generation = rooms, backplane.generation
+        await asyncio.sleep(LOBBY_SYNC_INTERVAL)
+
+
+async def run_hub():
+    """Fan every line out to all other workers. Runs in the serve.py parent."""
+    writers = set()
+    last: Dict[tuple, bytes] = {}  # (sender, topic) -> last line, replayed to new workers
+
+    async def handle(reader, writer):
+        writers.add(writer)
+        for line in last.values():
+            writer.write(line)
+        sender = None
+        try:
+            async for line in reader:
+                msg = json.loads(line)
+                sender = msg["from"]
+                last[(sender, msg["topic"])] = line
+                for w in writers:
+                    if w is not writer:
+                        w.write(line)
+        except (OSError, ValueError):
+            pass
+        finally:
+            writers.discard(writer)
+            writer.close()
+            if sender is not None:
+                for key in [k for k in last if k[0] == sender]:
+                    del last[key]
+                down = (json.dumps({"from": sender, "topic": "worker_down", "data": None}) + "\n").encode()
+                for w in writers:
+                    w.write(down)
+
+    if os.path.exists(HUB_SOCKET):
+        os.unlink(HUB_SOCKET)
+    server = await asyncio.start_unix_server(handle, HUB_SOCKET)
+    async with server:
+        await server.serve_forever()
+
+
+async def proxy_websocket(websocket, room_id: str):
+    """Relay a client socket that hit the wrong worker to the room's owner."""
+    from fastapi import WebSocketDisconnect
+    from websockets.asyncio.client import unix_connect
+    from websockets.exceptions import ConnectionClosed
+
+    await websocket.accept()
+    headers = {}
+    if websocket.client:
+        headers["X-Forwarded-For"] = websocket.client.host
+    try:
+        upstream = await unix_connect(
+            worker_socket(owner_of(room_id)),
+            uri=f"ws://localhost{websocket.url.path}",
+            additional_headers=headers,
+        )
+    except OSError:
+        await websocket.close(code=1013)  # Try again later
+        return
+
+    async def client_to_owner():
+        try:
+            while True:
+                await upstream.send(await websocket.receive_text())
+        except (WebSocketDisconnect, ConnectionClosed):
+            pass
+
+    async def owner_to_client():
+        try:
+            async for message in upstream:
+                await websocket.send_text(message)
+        except (ConnectionClosed, RuntimeError):
+            pass
+
+    tasks = [asyncio.create_task(client_to_owner()), asyncio.create_task(owner_to_client())]
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for t in tasks:
+        t.cancel()
+    await upstream.close()
+    try:
+        # The reason too: a draining owner's retry-after spreads its clients' reconnects
+        await websocket.close(code=upstream.close_code or 1000, reason=upstream.close_reason or None)
+    except RuntimeError:
+        pass  # Client already gone
+
+
+async def proxy_http(request, room_id: str):
+    """Forward an HTTP request about a room to its owner and stream the answer back."""
+    return await proxy_http_to(request, owner_of(room_id))
+
+
+async def proxy_http_to(request, index: int):
+    from starlette.responses import Response, StreamingResponse
+
+    try:
+        reader, writer = await asyncio.open_unix_connection(worker_socket(index))
+    except OSError:
+        return Response(status_code=503)
+    body = await request.body()
+    path = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    skip = ("host", "connection", "content-length")
+    headers = "".join(f"{k}: {v}\r\n" for k, v in request.headers.items() if k.lower() not in skip)
+    # HTTP/1.0 so the owner answers without chunking and closes when done
+    writer.write(
+        f"{request.method} {path} HTTP/1.0\r\nHost: localhost\r\n{headers}Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+
+    status = int((await reader.readline()).split()[1])
+    response_headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        key, _, value = line.decode("latin-1").partition(":")
+        if key.lower() not in ("connection", "transfer-encoding"):
+            response_headers[key.strip()] = value.strip()
+
+    async def stream():
+        try:
+            while chunk := await reader.read(65536):
+                yield chunk
+        finally:
+            writer.close()
+
+    return StreamingResponse(stream(), status_code=status, headers=response_headers)
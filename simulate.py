@@ -0,0 +1,230 @@
+"""
+Headless games on virtual time: bots play full games (turn rotation, scoring,
+win detection, round timers) straight against a ConnectionManager, with no
+sockets and no real waiting. Whenever nothing is ready to run, the event loop's
+clock jumps to the next timer, so a 60 second round takes as long as its
+handlers do.
+
+    python simulate.py --games 1000 --players 6
+    python simulate.py --games 200 --seed 7 --concurrency 50
+
+The manager's clock follows the loop and its RNG comes from --seed, as do the
+bots', so a run is reproducible: the same seed and arguments print the same digest.
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import random
+import selectors
+import time
+
+import metrics
+import offload
+from manager import ConnectionManager
+
+# Virtual time starts here rather than at 0, so timer_end looks like a real timestamp
+EPOCH = 1_700_000_000.0
+
+WRONG_GUESSES = ["cat", "house", "tree", "sun", "car", "dog", "boat", "apple"]
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Polls real I/O without blocking; with none ready, moves the loop's clock on to its next timer."""
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        # Only a thread (the self-pipe) can wake us now. Threads run in real
+        # time, so the clock waits for offload jobs rather than racing past them.
+        if timeout is None or offload.in_flight():
+            return super().select(None if timeout is None else 0.1)
+        self.loop.virtual_now += timeout
+        return []
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """An event loop on virtual time: sleeps and timeouts return as soon as nothing else can run."""
+
+    def __init__(self):
+        selector = _VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self.virtual_now = 0.0
+
+    def time(self):
+        return self.virtual_now
+
+
+class SimSocket:
+    """Stands in for a player's WebSocket. The host's keeps a digest of what the room sent and wakes its bots."""
+
+    def __init__(self, game=None):
+        self.game = game
+
+    async def send_text(self, text):
+        if self.game:
+            self.game.received(text)
+
+    async def close(self, code=1000):
+        pass
+
+
+class Game:
+    def __init__(self, mgr: ConnectionManager, args, index: int):
+        self.mgr = mgr
+        self.args = args
+        self.index = index
+        self.rng = random.Random(f"{args.seed}-{index}")
+        self.digest = hashlib.sha256()
+        self.changed = asyncio.Event()
+        self.tasks = set()
+        self.room_id = None
+        self.rounds = 0
+        self.seconds = 0.0  # Virtual time from start to GAME_OVER
+
+    def received(self, text: str):
+        self.digest.update(text.encode())
+        self.changed.set()
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def current(self, round_number: int, phase: str) -> bool:
+        room = self.mgr.rooms.get(self.room_id)
+        gs = room.game_state if room else None
+        return gs is not None and gs.round == round_number and gs.phase == phase
+
+    async def play(self):
+        mgr, args = self.mgr, self.args
+        self.room_id = mgr.create_room(f"sim-{self.index}", config={"round_duration": args.round_duration})
+        room = mgr.rooms[self.room_id]
+        mgr.active_connections[self.room_id] = {}
+        for i in range(args.players):
+            nickname = f"p{i}"
+            mgr.try_join_room(self.room_id, f"c{i}", nickname)
+            mgr.active_connections[self.room_id][f"c{i}"] = SimSocket(self if i == 0 else None)
+            mgr.set_player_ready(self.room_id, nickname, True)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            await mgr.submit(self.room_id, mgr.start_game, self.room_id)
+            seen = None
+            while True:
+                await self.changed.wait()
+                self.changed.clear()
+                gs = room.game_state
+                if gs.phase == "GAME_OVER":
+                    self.seconds = loop.time() - started
+                    break
+                if (gs.round, gs.phase) == seen:
+                    continue
+                seen = (gs.round, gs.phase)
+                if gs.phase == "DRAWER_PREPARING":
+                    self.spawn(self.start_round(gs.round))
+                elif gs.phase == "DRAWING":
+                    self.rounds += 1
+                    self.spawn(self.draw(gs.drawer, gs.round))
+                    for nickname in room.players:
+                        if nickname != gs.drawer:
+                            self.spawn(self.guess(nickname, gs.round, gs.word))
+        finally:
+            for task in list(self.tasks):
+                task.cancel()
+            await mgr.close_room(self.room_id)
+        return self.digest.hexdigest()
+
+    async def start_round(self, round_number: int):
+        await asyncio.sleep(self.rng.uniform(1, 5))
+        if self.current(round_number, "DRAWER_PREPARING"):
+            await self.mgr.submit(self.room_id, self.mgr.start_active_round, self.room_id)
+
+    async def draw(self, drawer: str, round_number: int):
+        mgr, rng = self.mgr, self.rng
+        x, y = rng.random(), rng.random()
+        for i in range(self.args.strokes):
+            await asyncio.sleep(rng.uniform(0.05, 1))
+            if not self.current(round_number, "DRAWING"):
+                return
+            nx = min(1.0, max(0.0, x + rng.uniform(-0.05, 0.05)))
+            ny = min(1.0, max(0.0, y + rng.uniform(-0.05, 0.05)))
+            stroke = {"x1": x, "y1": y, "x2": nx, "y2": ny, "color": "#EF4444", "actionId": f"r{round_number}-{i // 10}"}
+            await mgr.submit(self.room_id, self.stroke, drawer, stroke)
+            x, y = nx, ny
+
+    async def stroke(self, drawer: str, stroke: dict):
+        # What main.py does with a DRAW_STROKE
+        stored = await self.mgr.record_stroke(self.room_id, drawer, stroke, 100)
+        if stored is not None:
+            await self.mgr.broadcast(self.room_id, {"type": "DRAW_STROKE", "payload": stored}, exclude_client="c0")
+
+    async def guess(self, nickname: str, round_number: int, word: str):
+        # A few wrong guesses, then the word; solving after the timer means never solving
+        mgr, rng = self.mgr, self.rng
+        solve_at = rng.uniform(2, self.args.round_duration * 1.2)
+        elapsed = 0.0
+        for _ in range(rng.randint(0, 3)):
+            wait = rng.uniform(1, 10)
+            elapsed += wait
+            await asyncio.sleep(wait)
+            if not self.current(round_number, "DRAWING"):
+                return
+            await mgr.submit(self.room_id, mgr.process_chat_message, self.room_id, nickname, rng.choice(WRONG_GUESSES))
+        await asyncio.sleep(max(0.0, solve_at - elapsed))
+        if self.current(round_number, "DRAWING"):
+            await mgr.submit(self.room_id, mgr.process_chat_message, self.room_id, nickname, word)
+
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    mgr = ConnectionManager(clock=lambda: EPOCH + loop.time(), rng=random.Random(args.seed))
+    games = [Game(mgr, args, i) for i in range(args.games)]
+    digests = [None] * args.games
+    pending = iter(games)
+
+    async def worker():
+        for game in pending:
+            digests[game.index] = await game.play()
+
+    await asyncio.gather(*(worker() for _ in range(min(args.concurrency, args.games))))
+    digest = hashlib.sha256("".join(digests).encode()).hexdigest()
+    return games, digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--concurrency", type=int, default=100, help="Games in progress at once")
+    parser.add_argument("--round-duration", type=int, default=60)
+    parser.add_argument("--strokes", type=int, default=20, help="Strokes the drawer sends per round")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Slow-handler warnings would only add noise here
+    logging.disable(logging.WARNING)
+
+    expired = metrics.round_timers_expired.values.get((), 0)
+    started = time.perf_counter()
+    with asyncio.Runner(loop_factory=VirtualTimeLoop) as runner:
+        games, digest = runner.run(run(args))
+    elapsed = time.perf_counter() - started
+
+    rounds = sum(g.rounds for g in games)
+    expired = metrics.round_timers_expired.values.get((), 0) - expired
+    print(f"games:         {len(games)} ({rounds} rounds, {expired:.0f} ended by the timer)")
+    played = sum(g.seconds for g in games)
+    print(f"game time:     {played / 3600:.1f} h played in {elapsed:.2f} s wall ({played / elapsed:,.0f}x real time)")
+    print(f"throughput:    {len(games) / elapsed:,.1f} games/s, {rounds / elapsed:,.1f} rounds/s")
+    print(f"digest:        {digest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip only without it
+    brotli = None
+
+# Serves static/ from memory. Every file is read and precompressed (br, gzip)
+# once, carries a strong ETag and Last-Modified, and answers revalidation with
+# 304. HTML references to /static/... get a ?v=<hash> fingerprint; requests
+# carrying the current fingerprint are cached as immutable.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"  # HTML: always revalidate, a 304 is cheap
+DEFAULT_CACHE = "public, max-age=3600"
+
+ASSET_REF = re.compile(r"""(["'])/static/([\w./-]+)\1""")
+
+
+class Asset:
+    def __init__(self, data: bytes, mtime: float, media_type: str):
+        digest = hashlib.sha1(data).hexdigest()
+        self.version = digest[:10]
+        self.media_type = media_type
+        self.last_modified = formatdate(mtime, usegmt=True)
+        # encoding -> (body, etag)
+        self.variants: Dict[str, tuple] = {"identity": (data, f'"{digest[:16]}"')}
+        if media_type.startswith(COMPRESSIBLE):
+            candidates = {"gzip": gzip.compress(data, 9, mtime=0)}
+            if brotli is not None:
+                candidates["br"] = brotli.compress(data, quality=11)
+            for encoding, body in candidates.items():
+                if len(body) < len(data):
+                    self.variants[encoding] = (body, f'"{digest[:16]}-{encoding}"')
+
+
+class AssetStore:
+    def __init__(self, directory: str = STATIC_DIR):
+        self.directory = directory
+        self.assets: Dict[str, Asset] = {}
+        self._encoding_cache: Dict[str, tuple] = {}
+
+    def load(self):
+        assets = {}
+        html = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, self.directory).replace(os.sep, "/")
+                if rel.endswith(".html"):
+                    html.append((rel, full))
+                    continue
+                assets[rel] = self._read(full)
+        # HTML last, so it can reference the fingerprints of everything else
+        for rel, full in html:
+            with open(full, encoding="utf-8") as f:
+                text = f.read()
+            text = ASSET_REF.sub(lambda m: self._fingerprint(m, assets), text)
+            assets[rel] = Asset(text.encode(), os.path.getmtime(full), "text/html; charset=utf-8")
+        self.assets = assets
+
+    def _read(self, full: str) -> Asset:
+        with open(full, "rb") as f:
+            data = f.read()
+        media_type = mimetypes.guess_type(full)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type in ("application/javascript", "application/json"):
+            media_type += "; charset=utf-8"
+        return Asset(data, os.path.getmtime(full), media_type)
+
+    @staticmethod
+    def _fingerprint(match, assets) -> str:
+        quote, path = match.group(1), match.group(2)
+        asset = assets.get(path)
+        if asset is None:
+            return match.group(0)
+        return f"{quote}/static/{path}?v={asset.version}{quote}"
+
+    def _encodings(self, accept: str) -> tuple:
+        # Preference order among what the client accepts; few distinct headers in practice
+        cached = self._encoding_cache.get(accept)
+        if cached is None:
+            accepted = set()
+            for part in accept.lower().split(","):
+                name, _, params = part.strip().partition(";")
+                if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                    continue
+                accepted.add(name.strip())
+            cached = tuple(e for e in ("br", "gzip") if e in accepted or "*" in accepted) + ("identity",)
+            if len(self._encoding_cache) < 256:
+                self._encoding_cache[accept] = cached
+        return cached
+
+    def response(self, request: Request, path: str, cache_control: Optional[str] = None) -> Response:
+        if not self.assets:
+            self.load()
+        asset = self.assets.get(path)
+        if asset is None:
+            return Response(status_code=404)
+
+        if cache_control is None:
+            version = request.query_params.get("v")
+            if version is not None and version == asset.version:
+                cache_control = IMMUTABLE
+            elif path.endswith(".html"):
+                cache_control = REVALIDATE
+            else:
+                cache_control = DEFAULT_CACHE
+
+        for encoding in self._encodings(request.headers.get("accept-encoding", "")):
+            if encoding in asset.variants:
+                break
+        body, etag = asset.variants[encoding]
+        headers = {
+            "ETag": etag,
+            "Last-Modified": asset.last_modified,
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # Any variant of the same content is still valid
+            base = asset.variants["identity"][1][:-1]
+            if if_none_match.strip() == "*" or base in if_none_match:
+                return Response(status_code=304, headers=headers)
+        elif request.headers.get("if-modified-since") == asset.last_modified:
+            return Response(status_code=304, headers=headers)
+
+        return Response(body, headers=headers, media_type=asset.media_type)
+
+
+assets = AssetStore()
@@ -0,0 +1,192 @@
+import json
+from functools import lru_cache
+from typing import List, Optional
+
+from constants import DRAW_COLORS
+
+# Stroke history holds two kinds of entries, coordinates are 0..1 fractions:
+#   DRAW_STROKE segments: {x1, y1, x2, y2, color, actionId}
+#   DRAW_PATH polylines:  {actionId, color, width, points: [x0, y0, x1, y1, ...]}
+# A DRAW_PATH message is one of
+#   {"op": "begin", actionId, color, width, points}  opens a polyline
+#   {"op": "append", actionId, points}               extends it
+#   {"op": "end", actionId}                          closes it
+# The open polyline is always the last history entry: nothing else is drawn while it's open.
+#
+# What drawers send is put in canonical form before it's stored or relayed: coordinates
+# clamped to the canvas and rounded to COMPACT_PRECISION, colors mapped onto DRAW_COLORS,
+# widths clamped, unknown fields dropped. Anything that doesn't fit the shape is dropped whole.
+
+COORDS = ("x1", "y1", "x2", "y2")
+COMPACT_PRECISION = 4  # 1e-4 of the canvas is 0.2px on the 2000px internal canvas
+COLLINEAR_TOLERANCE = 0.02  # ~1 degree
+MAX_ACTION_ID_LENGTH = 32
+MIN_WIDTH, MAX_WIDTH = 1, 100  # Internal canvas pixels
+
+_NUMBER = (int, float)  # Exact types: bools are out
+_SCALE = 10 ** COMPACT_PRECISION
+_PALETTE = {c: c for c in DRAW_COLORS}
+_PALETTE_RGB = [(c, int(c[1:3], 16), int(c[3:5], 16), int(c[5:7], 16)) for c in DRAW_COLORS]
+
+
+def _coord(v) -> Optional[float]:
+    # Clamped to the canvas, then quantized like round(v, COMPACT_PRECISION) at a
+    # fraction of the cost: this runs for every coordinate a drawer sends
+    if type(v) not in _NUMBER:
+        return None
+    if not 0.0 <= v <= 1.0:
+        if v != v:
+            return None  # NaN: no side of the canvas to clamp it to
+        v = 1.0 if v > 0.0 else 0.0
+    return int(v * _SCALE + 0.5) / _SCALE
+
+
+def _coords(points) -> Optional[List[float]]:
+    if not isinstance(points, list) or len(points) % 2:
+        return None
+    out = [_coord(v) for v in points]
+    return None if None in out else out
+
+
+def _valid_action_id(action_id) -> bool:
+    # Legacy segments come without one; undo then removes them one by one
+    return action_id is None or (isinstance(action_id, str) and len(action_id) <= MAX_ACTION_ID_LENGTH)
+
+
+def canonical_color(color) -> Optional[str]:
+    """The palette color for a #RRGGBB color: itself if it's in DRAW_COLORS, else the nearest one."""
+    if not isinstance(color, str):
+        return None
+    color = color.upper()
+    known = _PALETTE.get(color)
+    if known is not None:
+        return known
+    if len(color) != 7 or color[0] != "#":
+        return None
+    return _nearest_color(color)
+
+
+@lru_cache(maxsize=1024)
+def _nearest_color(color: str) -> Optional[str]:
+    try:
+        r, g, b = int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+    except ValueError:
+        return None
+    return min(_PALETTE_RGB, key=lambda p: (p[1] - r) ** 2 + (p[2] - g) ** 2 + (p[3] - b) ** 2)[0]
+
+
+def canonical_segment(stroke) -> Optional[dict]:
+    """A DRAW_STROKE payload in canonical form, or None if it isn't one."""
+    if not isinstance(stroke, dict):
+        return None
+    out = {}
+    for k in COORDS:
+        v = _coord(stroke.get(k))
+        if v is None:
+            return None
+        out[k] = v
+    color = canonical_color(stroke.get("color"))
+    action_id = stroke.get("actionId")
+    if color is None or not _valid_action_id(action_id):
+        return None
+    out["color"] = color
+    if action_id is not None:
+        out["actionId"] = action_id
+    return out
+
+
+def canonical_path_op(op) -> Optional[dict]:
+    """A DRAW_PATH payload in canonical form, or None if it isn't one."""
+    if not isinstance(op, dict):
+        return None
+    kind, action_id = op.get("op"), op.get("actionId")
+    if not _valid_action_id(action_id):
+        return None
+    if kind == "end":
+        return {"op": "end", "actionId": action_id}
+    points = _coords(op.get("points", []) if kind == "begin" else op.get("points"))
+    if points is None:
+        return None
+    if kind == "append":
+        return {"op": "append", "actionId": action_id, "points": points} if points else None
+    if kind == "begin":
+        color, width = canonical_color(op.get("color")), op.get("width")
+        if color is None or type(width) not in _NUMBER or width != width:
+            return None
+        width = round(min(MAX_WIDTH, max(MIN_WIDTH, width)))
+        return {"op": "begin", "actionId": action_id, "color": color, "width": width, "points": points}
+    return None
+
+
+def _is_segment(stroke) -> bool:
+    return isinstance(stroke, dict) and all(isinstance(stroke.get(k), (int, float)) for k in COORDS)
+
+
+def _extends(prev: dict, stroke: dict) -> bool:
+    # Same pen, continues where prev ended and keeps (almost) the same direction
+    if prev.get("actionId") != stroke.get("actionId") or prev.get("color") != stroke.get("color"):
+        return False
+    if prev["x2"] != stroke["x1"] or prev["y2"] != stroke["y1"]:
+        return False
+    ax, ay = prev["x2"] - prev["x1"], prev["y2"] - prev["y1"]
+    bx, by = stroke["x2"] - stroke["x1"], stroke["y2"] - stroke["y1"]
+    dot = ax * bx + ay * by
+    cross = ax * by - ay * bx
+    return dot > 0 and abs(cross) <= COLLINEAR_TOLERANCE * dot
+
+
+def _is_path(stroke) -> bool:
+    return isinstance(stroke, dict) and isinstance(stroke.get("points"), list)
+
+
+def apply_path_op(history: List, op: dict) -> Optional[int]:
+    """
+    Applies a canonical_path_op() to history. Returns the bytes it added,
+    or None to drop it.
+    """
+    kind = op["op"]
+    if kind == "begin":
+        path = {"actionId": op["actionId"], "color": op["color"], "width": op["width"], "points": list(op["points"])}
+        history.append(path)
+        return len(json.dumps(path))
+    # Appends to a path that was undone, cleared or never begun are dropped
+    path = history[-1] if history else None
+    if not _is_path(path) or path.get("actionId") != op["actionId"]:
+        return None
+    if kind == "append":
+        points = op["points"]
+        path["points"].extend(points)
+        # Same length as json.dumps for a list of numbers, at a fraction of the cost
+        return len(repr(points))
+    if kind == "end":
+        return 0
+    return None
+
+
+def snapshot_history(history: List) -> List:
+    """A copy of history that later strokes won't change: only the open polyline is ever modified in place."""
+    snapshot = list(history)
+    if snapshot and _is_path(snapshot[-1]):
+        snapshot[-1] = dict(snapshot[-1], points=list(snapshot[-1]["points"]))
+    return snapshot
+
+
+def compact_history(history: List[dict]) -> List[dict]:
+    """Round coordinates and merge consecutive collinear segments of the same action."""
+    out = []
+    for stroke in history:
+        if _is_path(stroke):
+            out.append(dict(stroke, points=[round(v, COMPACT_PRECISION) for v in stroke["points"]]))
+            continue
+        if not _is_segment(stroke):
+            out.append(stroke)
+            continue
+        stroke = dict(stroke)
+        for k in COORDS:
+            stroke[k] = round(stroke[k], COMPACT_PRECISION)
+        prev = out[-1] if out else None
+        if prev is not None and _is_segment(prev) and _extends(prev, stroke):
+            prev["x2"], prev["y2"] = stroke["x2"], stroke["y2"]
+        else:
+            out.append(stroke)
+    return out
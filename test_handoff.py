@@ -0,0 +1,61 @@
+import asyncio
+import json
+import os
+import pickle
+
+import handoff
+from manager import ConnectionManager, room_to_fields
+from models import GameState
+
+
+def test_write_then_read_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(handoff, "HANDOFF_DIR", str(tmp_path / "handoff"))
+    snapshot = {"version": handoff.VERSION, "drained_at": 1000.0, "rooms": []}
+    handoff.write(pickle.dumps(snapshot))
+    assert os.listdir(tmp_path / "handoff") == [os.path.basename(handoff.path())]
+    assert handoff.read() == snapshot
+    # Removed once read, so a later restart doesn't bring the rooms back
+    assert handoff.read() is None
+    assert not os.path.exists(handoff.path())
+
+
+def test_read_drops_unusable_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(handoff, "HANDOFF_DIR", str(tmp_path))
+    handoff.write(pickle.dumps({"version": handoff.VERSION + 1, "rooms": []}))
+    assert handoff.read() is None
+    assert not os.path.exists(handoff.path())
+    handoff.write(b"not a pickle")
+    assert handoff.read() is None
+    assert not os.path.exists(handoff.path())
+
+
+def test_restore_gives_the_round_its_time_back():
+    async def run():
+        now = [1000.0]
+        old = ConnectionManager(clock=lambda: now[0])
+        room_id = old.create_room("deploy")
+        for i in range(2):
+            old.try_join_room(room_id, f"c{i}", f"p{i}")
+        old.rooms[room_id].game_state = GameState(round=1, drawer="p0", word="Banana", phase="DRAWING", timer_end=1040.0)
+        await old.broadcast(room_id, {"type": "CHAT", "payload": {"text": "before"}})
+        snapshot = {"version": handoff.VERSION, "drained_at": now[0], "rooms": [room_to_fields(old.rooms[room_id])]}
+
+        now[0] += 10  # The restart
+        new = ConnectionManager(clock=lambda: now[0])
+        restored = await new.restore(snapshot)
+        timer = new.round_timers.get(room_id)
+        if timer is not None:
+            timer.cancel()
+        return new, room_id, restored, timer
+
+    mgr, room_id, restored, timer = asyncio.run(run())
+    room = mgr.rooms[room_id]
+    assert restored == 1
+    assert room.game_state.timer_end == 1050.0  # Still 40s left, not 30
+    assert timer is not None
+    assert not any(p.connected for p in room.players.values())
+    assert room.empty_since == 1010.0
+    # Clients resuming from before the drain are told the new timer_end
+    replay = [json.loads(t) for t in mgr.messages_since(room_id, "c1", "p1", 0)]
+    assert [m["type"] for m in replay] == ["CHAT", "GAME_STATE_UPDATE"]
+    assert replay[1]["payload"]["game_state"]["timer_end"] == 1050.0
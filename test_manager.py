@@ -0,0 +1,265 @@
+import asyncio
+import dataclasses
+import json
+
+from manager import ConnectionManager, batch_text, merge_config
+from models import GameConfig, GameState
+from settings import HIBERNATE_AFTER
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.texts = []
+
+    async def send_text(self, text):
+        self.texts.append(text)
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+
+def flatten(texts):
+    """Messages in delivery order, BATCHes expanded, with the seq each arrived under."""
+    out = []
+    for text in texts:
+        msg = json.loads(text)
+        if msg["type"] == "BATCH":
+            out.extend((m["type"], m["payload"], msg.get("seq")) for m in msg["payload"]["messages"])
+        else:
+            out.append((msg["type"], msg["payload"], msg.get("seq")))
+    return out
+
+
+def test_mixed_batch_keeps_order():
+    # Coalesced types (CHAT, DRAW_STROKE) queued by an actor batch must not be overtaken
+    # by the plain broadcasts, game state pushes and direct sends handled after them
+    async def run():
+        mgr = ConnectionManager()
+        room_id = mgr.create_room("order")
+        room = mgr.rooms[room_id]
+        mgr.active_connections[room_id] = {}
+        sockets = {}
+        for i in range(2):
+            mgr.try_join_room(room_id, f"c{i}", f"p{i}")
+            sockets[f"c{i}"] = mgr.active_connections[room_id][f"c{i}"] = RecordingSocket()
+        room.game_state = GameState(round=1, drawer="p0", word="Banana", phase="DRAWING")
+
+        def broadcast(msg_type, payload):
+            return mgr.broadcast(room_id, {"type": msg_type, "payload": payload})
+
+        stroke = {"x1": 0.1, "y1": 0.1, "x2": 0.2, "y2": 0.2, "color": "#EF4444", "actionId": "a1"}
+        # Queued before the actor first runs, so they are handled as one batch
+        await mgr.submit(room_id, broadcast, "CHAT", {"text": "first"})
+        await mgr.submit(room_id, broadcast, "PLAYER_UPDATE", {"nickname": "p1", "is_ready": True})
+        await mgr.submit(room_id, broadcast, "DRAW_STROKE", stroke)
+        await mgr.submit(room_id, mgr.broadcast_game_state, room_id)
+        await mgr.submit(room_id, broadcast, "CHAT", {"text": "second"})
+        await mgr.submit(room_id, mgr.send_to_client, room_id, "c1", {"type": "ERROR", "payload": {}})
+        await mgr.submit(room_id, broadcast, "DRAW_STROKE", dict(stroke, actionId="a2"))
+        await mgr.submit(room_id, broadcast, "CLEAR_CANVAS", {})
+        await mgr.settle(room_id)
+        return mgr, room_id, sockets
+
+    mgr, room_id, sockets = asyncio.run(run())
+    expected = [
+        "CHAT", "PLAYER_UPDATE", "DRAW_STROKE", "GAME_STATE_UPDATE", "CHAT", "ERROR", "DRAW_STROKE", "CLEAR_CANVAS"
+    ]
+    received = flatten(sockets["c1"].texts)
+    assert [t for t, _, _ in received] == expected
+    assert [p["text"] for t, p, _ in received if t == "CHAT"] == ["first", "second"]
+
+    # Everything but the direct send is sequenced, in the order it was delivered
+    seqs = [seq for t, _, seq in received if t != "ERROR"]
+    assert None not in seqs
+    assert seqs == sorted(seqs)
+    # and a client resuming from the start replays the same order
+    replayed = flatten(mgr.messages_since(room_id, "c0", "p0", 0))
+    assert [t for t, _, _ in replayed] == [t for t in expected if t != "ERROR"]
+
+
+def test_roster_deltas_get_increasing_versions():
+    # Clients skip roster messages at or below the version they have, so coalesced joins
+    # flushed after a ready toggle in the same window must still come with a newer one
+    async def run():
+        mgr = ConnectionManager()
+        room_id = mgr.create_room("roster")
+        room = mgr.rooms[room_id]
+        mgr.active_connections[room_id] = {}
+        sockets = {}
+        for i in range(3):
+            mgr.try_join_room(room_id, f"c{i}", f"p{i}")
+            sockets[f"c{i}"] = mgr.active_connections[room_id][f"c{i}"] = RecordingSocket()
+            await mgr.announce_join(room_id, f"p{i}")  # p0 now, p1 and p2 when the window closes
+        mgr.set_player_ready(room_id, "p0", True)
+        await mgr.broadcast(room_id, {
+            "type": "PLAYER_UPDATE",
+            "payload": {"nickname": "p0", "is_ready": True, "roster_version": room.roster_version}
+        })
+        await asyncio.sleep(0.3)
+        await mgr.settle(room_id)
+        return sockets
+
+    sockets = asyncio.run(run())
+    received = [(t, p) for t, p, _ in flatten(sockets["c0"].texts) if "roster_version" in p]
+    assert [t for t, _ in received] == ["PLAYER_JOINED", "PLAYER_UPDATE", "PLAYERS_JOINED"]
+    versions = [p["roster_version"] for _, p in received]
+    assert versions == sorted(set(versions))
+    assert [p["nickname"] for p in received[-1][1]["players"]] == ["p1", "p2"]
+
+
+def test_actor_outlives_cancelled_handler_and_stops_with_its_room():
+    # A handler whose awaited job gets cancelled (as offload.cancel does) must not take the
+    # actor down with it; closing the room stops the actor without cancelling it
+    async def run():
+        mgr = ConnectionManager()
+        room_id = mgr.create_room("actor")
+        ran = []
+
+        async def cancelled_job():
+            job = asyncio.get_running_loop().create_future()
+            job.cancel()
+            await job
+
+        async def after():
+            ran.append("after")
+
+        await mgr.submit(room_id, cancelled_job)
+        await mgr.submit(room_id, after)
+        await mgr.settle(room_id)
+        actor = mgr.actors[room_id]
+        await mgr.close_room(room_id)
+        await asyncio.wait_for(actor, 1)
+        return mgr, room_id, actor, ran, await mgr.submit(room_id, after)
+
+    mgr, room_id, actor, ran, queued = asyncio.run(run())
+    assert ran == ["after"]
+    assert not actor.cancelled()
+    assert room_id not in mgr.actors and room_id not in mgr.inboxes
+    assert queued is False
+
+
+def test_outbox_bytes_follow_the_outbox():
+    # room_memory reads the running count, so it has to survive the deque dropping old entries
+    async def run():
+        mgr = ConnectionManager()
+        room_id = mgr.create_room("outbox")
+        room = mgr.rooms[room_id]
+        mgr.try_join_room(room_id, "c0", "p0")
+        for i in range(room.outbox.maxlen + 10):
+            await mgr.broadcast(room_id, {"type": "CHAT", "payload": {"text": "x" * (i % 7)}})
+        return mgr, room_id, room
+
+    mgr, room_id, room = asyncio.run(run())
+    assert len(room.outbox) == room.outbox.maxlen
+    assert room.outbox_bytes == sum(len(entry[1]) for entry in room.outbox)
+    usage = mgr.room_memory(room_id)
+    assert usage["outbox"] == room.outbox_bytes
+    assert usage["players"] == len(json.dumps(room.player_list()))
+
+
+def test_messages_since_replays_what_the_client_missed():
+    async def run():
+        mgr = ConnectionManager()
+        room_id = mgr.create_room("resume")
+        room = mgr.rooms[room_id]
+        for i in range(2):
+            mgr.try_join_room(room_id, f"c{i}", f"p{i}")
+        room.game_state = GameState(round=1, drawer="p1", word="Banana", phase="DRAWING")
+        await mgr.broadcast(room_id, {"type": "CHAT", "payload": {"text": "seen"}})
+        left_at = room.seq
+        await mgr.broadcast(room_id, {"type": "CHAT", "payload": {"text": "missed"}})
+        await mgr.broadcast(room_id, {"type": "DRAW_STROKE", "payload": {}}, exclude_client="c1")  # Its own
+        await mgr.broadcast_game_state(room_id)
+        await mgr.broadcast(room_id, {"type": "CLEAR_CANVAS", "payload": {}})
+        return mgr, room_id, room, left_at
+
+    mgr, room_id, room, left_at = asyncio.run(run())
+    missed = mgr.messages_since(room_id, "c1", "p1", left_at)
+    # Resuming sends JOIN_SUCCESS and the missed messages as one BATCH, in sequence order
+    resumed = json.loads(batch_text([mgr.join_success_text(room_id, {"seq": room.seq})] + missed))["payload"]["messages"]
+    assert [m["type"] for m in resumed] == ["JOIN_SUCCESS", "CHAT", "GAME_STATE_UPDATE", "CLEAR_CANVAS"]
+    assert [m["seq"] for m in resumed[1:]] == [left_at + 1, left_at + 3, left_at + 4]
+    # The drawer gets back its own view of the state, with the word
+    assert resumed[2]["payload"]["game_state"]["word"] == "Banana"
+    assert json.loads(mgr.messages_since(room_id, "c0", "p0", left_at)[2])["payload"]["game_state"]["word"] is None
+
+    assert mgr.messages_since(room_id, "c1", "p1", room.seq) == []
+    assert mgr.messages_since(room_id, "c1", "p1", room.seq + 1) is None  # From before a restart
+
+
+def test_messages_since_needs_full_state_once_the_outbox_overflowed():
+    async def run():
+        mgr = ConnectionManager()
+        room_id = mgr.create_room("overflow")
+        room = mgr.rooms[room_id]
+        mgr.try_join_room(room_id, "c0", "p0")
+        for i in range(room.outbox.maxlen + 1):
+            await mgr.broadcast(room_id, {"type": "CHAT", "payload": {"text": str(i)}})
+        return mgr, room_id, room
+
+    mgr, room_id, room = asyncio.run(run())
+    oldest = room.outbox[0][0]
+    assert oldest == 2
+    assert mgr.messages_since(room_id, "c0", "p0", 0) is None  # Seq 1 is gone
+    assert len(mgr.messages_since(room_id, "c0", "p0", oldest - 1)) == room.outbox.maxlen
+
+
+def test_hibernated_room_wakes_as_it_was():
+    # Broadcasts made while the room sleeps (a reaped player, say) go after the frozen ones
+    async def run():
+        now = [1000.0]
+        mgr = ConnectionManager(clock=lambda: now[0])
+        room_id = mgr.create_room("sleepy")
+        room = mgr.rooms[room_id]
+        mgr.try_join_room(room_id, "c0", "p0")
+        stroke = {"x1": 0.1, "y1": 0.1, "x2": 0.2, "y2": 0.2, "color": "#EF4444"}
+        room.game_state = GameState(
+            round=3, drawer="p0", word="Banana", phase="GAME_OVER",
+            turn_results={"p0": {"points": 10, "time": 5}}, stroke_history=[stroke], used_words={"Banana"}
+        )
+        for i in range(3):
+            await mgr.broadcast(room_id, {"type": "CHAT", "payload": {"text": str(i)}})
+        awake = dataclasses.replace(room.game_state)
+        outbox, outbox_bytes = list(room.outbox), room.outbox_bytes
+
+        now[0] += HIBERNATE_AFTER
+        await mgr.hibernate_room(room_id)
+        asleep = (room.hibernated is not None, room.game_state, len(room.outbox))
+        await mgr.broadcast(room_id, {"type": "PLAYER_DISCONNECTED", "payload": {"nickname": "p0"}})
+
+        async def touch():
+            pass
+
+        await mgr.submit(room_id, touch)  # Any input wakes it, on the actor
+        await mgr.settle(room_id)
+        return mgr, room_id, room, awake, outbox, outbox_bytes, asleep
+
+    mgr, room_id, room, awake, outbox, outbox_bytes, asleep = asyncio.run(run())
+    assert asleep == (True, None, 0)
+    assert room.hibernated is None
+    assert room.game_state == awake
+    assert room.outbox[0][0] == 1 and [e[0] for e in room.outbox] == list(range(1, room.seq + 1))
+    assert list(room.outbox)[:3] == outbox
+    assert room.outbox_bytes == outbox_bytes + len(room.outbox[-1][1])
+    assert [json.loads(t)["type"] for t in mgr.messages_since(room_id, "c0", "p0", 0)] == ["CHAT"] * 3 + ["PLAYER_DISCONNECTED"]
+
+
+def test_merge_config_drops_only_the_bad_changes():
+    current = dict(GameConfig().dict(), round_duration=90, points_to_win=100)
+    merged = merge_config(current, {
+        "round_duration": 120,
+        "points_to_win": 1000,  # Over the limit
+        "turn_order": "random",  # Not an option
+        "host_plays": "maybe",
+        "word_language": "x" * 65,
+        "bogus": 1,
+    })
+    assert merged == dict(current, round_duration=120)
+
+
+def test_merge_config_keeps_base_points_within_points_to_win():
+    current = dict(GameConfig().dict(), points_to_win=100, base_points=40)
+    assert merge_config(current, {"points_to_win": 20})["base_points"] == 20
+    # A bad change to one doesn't undo the clamp against the other
+    merged = merge_config(current, {"points_to_win": 30, "base_points": 0})
+    assert (merged["points_to_win"], merged["base_points"]) == (30, 30)
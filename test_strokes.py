@@ -0,0 +1,37 @@
+from strokes import canonical_path_op, canonical_segment
+
+NAN = float("nan")
+
+
+def test_path_op_in_canonical_form():
+    op = {"op": "begin", "actionId": "a", "color": "#fffffe", "width": 1e9, "points": [0.123456, -3, 2, 0.5], "x": 1}
+    assert canonical_path_op(op) == {
+        "op": "begin", "actionId": "a", "color": "#FFFFFF", "width": 100, "points": [0.1235, 0.0, 1.0, 0.5]
+    }
+    assert canonical_path_op({"op": "append", "actionId": "a", "points": [1, 0]}) == {
+        "op": "append", "actionId": "a", "points": [1.0, 0.0]
+    }
+    assert canonical_path_op({"op": "end", "actionId": "a", "junk": 1}) == {"op": "end", "actionId": "a"}
+
+
+def test_path_op_rejects_malformed_input():
+    begin = {"op": "begin", "actionId": "a", "color": "#000000", "width": 4, "points": [0.1, 0.2]}
+    assert canonical_path_op(dict(begin, points=[0.1, NAN])) is None
+    assert canonical_path_op(dict(begin, width=NAN)) is None
+    assert canonical_path_op(dict(begin, points=[0.1, True])) is None
+    assert canonical_path_op(dict(begin, width=True)) is None
+    assert canonical_path_op(dict(begin, points=[0.1, 0.2, 0.3])) is None
+    assert canonical_path_op({"op": "append", "actionId": "a", "points": [NAN, 0.5]}) is None
+    assert canonical_path_op({"op": "append", "actionId": "a", "points": [False, 0.5]}) is None
+    assert canonical_path_op({"op": "append", "actionId": "a", "points": [0.5]}) is None
+    assert canonical_path_op({"op": "append", "actionId": "a", "points": []}) is None
+    assert canonical_path_op({"op": "end", "actionId": "a" * 33}) is None
+    assert canonical_path_op({"op": "nope", "actionId": "a"}) is None
+    assert canonical_path_op([0.1, 0.2]) is None
+
+
+def test_segment_rejects_nan_and_bools():
+    segment = {"x1": 0, "y1": 0, "x2": 1, "y2": 1, "color": "#000000"}
+    assert canonical_segment(segment) == {"x1": 0.0, "y1": 0.0, "x2": 1.0, "y2": 1.0, "color": "#000000"}
+    assert canonical_segment(dict(segment, y2=NAN)) is None
+    assert canonical_segment(dict(segment, x1=True)) is None